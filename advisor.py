@@ -0,0 +1,230 @@
+from dead import Detector
+from rules import rule_set
+from solver import Solver
+from state import EMPTY, PYRAMID, TARGET, row_col
+from collections import namedtuple
+from time import perf_counter
+
+# advice of position: move (tuple of card ids, None - draw or no moves),
+# confidence 0...1, proven - move is the first one of a won game, depth -
+# plies of the last finished search iteration, removals left to win for a
+# proven move
+Advice = namedtuple('Advice', 'move confidence proven depth')
+
+_WON = 1000  # value of won position
+_DEAD = -1  # value of position which cannot be won
+_NO_MOVES = object()  # root has no moves
+
+
+class _Timeout(Exception):
+    """Search deadline is reached."""
+
+
+class Advisor:
+    """Best move within a latency budget.
+
+    First the exact Solver gets a share of the budget: a found solution
+    gives a proven move. Otherwise iterative deepening search looks ahead
+    1, 2, ... plies (draws included) until the deadline and the move of
+    the last finished iteration is returned, so more time gives deeper
+    look-ahead. Leaves are scored by removed and open pyramid cards,
+    positions with a dead card (see dead.Detector) score lowest.
+    Confidence is the share of the pyramid removed at the end of the best
+    line, 1 for a proven move. The last proven line is remembered and
+    advanced one move per advice, so advice of the next positions follows
+    it without search; draws are inserted into it only as it is followed.
+    """
+
+    def __init__(self, level='easy', target=TARGET, aces_high=False,
+                 cache=None, proof_share=0.5, rules=None):
+        """
+        Initializing class.
+        :param level: 'easy' or 'hard' (pairs of the same suit)
+        :param target: sum of values of removed cards
+        :param aces_high: ace value is 14
+        :param cache: cache.PositionCache of the solver, None - no cache
+        :param proof_share: share of budget of the exact search
+        :param rules: RuleSet used instead of level, target and ace value
+        _plan - [position, its move, Solver.draws generator of the next
+        moves, count of removals left] of proven line, None - no line
+        nodes - positions searched by the last advise
+        """
+        assert 0 <= proof_share <= 1, 'incorrect proof share'
+        if rules is None:
+            rules = rule_set(level, target, aces_high)
+        self._cache = cache
+        self._proof_share = proof_share
+        self._rules = rules
+        self._detector = Detector(rules=rules)
+        self._plan = None
+        self.nodes = 0
+
+    @classmethod
+    def of_game(cls, game_logic, **options):
+        """Return advisor of rules of GameLogic object."""
+        return cls(rules=game_logic.rules, **options)
+
+    @property
+    def rules(self):
+        """Return RuleSet of advice."""
+        return self._rules
+
+    def advise(self, state, budget=0.02):
+        """Return Advice of position within budget.
+        :param state: GameState object, it is not changed
+        :param budget: search time in seconds"""
+        deadline = perf_counter() + budget
+        self.nodes = 0
+        if state.won:
+            return Advice(None, 1.0, True, 0)
+        if self._follow(state):
+            return Advice(self._plan[1], 1.0, True, self._plan[3])
+        solver = Solver(max_nodes=None, time_limit=budget * self._proof_share,
+                        cache=self._cache, rules=self._rules)
+        solvable, moves = solver.solve(state, draws=False)
+        self.nodes = solver.nodes
+        if solvable:
+            self._remember(state, moves)
+            return Advice(self._plan[1], 1.0, True, self._plan[3])
+
+        state = state.copy()
+        size = len(state.pyramid)
+        best = Advice(next(self._moves(state), None), 0.0, False, 0)
+        depth = 1
+        while perf_counter() < deadline:
+            try:
+                move, value = self._root(state, depth, deadline)
+            except _Timeout:
+                break
+            if move is _NO_MOVES:
+                break
+            if value >= _WON:
+                return Advice(move, 1.0, True, depth)
+            best = Advice(move, max(0.0, min(value, size) / size), False,
+                          depth)
+            depth += 1
+        return best
+
+    def _remember(self, state, moves):
+        """Replace plan by solution moves from state, see Solver.solve
+        without draws."""
+        line = state.copy()
+        steps = Solver.draws(line, moves)
+        self._plan = [line, next(steps), steps,
+                      sum(move is not None for move in moves)]
+
+    def _follow(self, state):
+        """Advance plan to state if it is the next position of the line.
+        :return: True if plan move is the move of state"""
+        if self._plan is None:
+            return False
+        line, move, steps, left = self._plan
+        key = state.hash, state.passes
+        if key == (line.hash, line.passes):
+            return True
+        # the next step plays the move on line
+        if move is not None:
+            left -= 1
+        move = next(steps, _NO_MOVES)
+        if move is _NO_MOVES or key != (line.hash, line.passes):
+            self._plan = None
+            return False
+        self._plan[1:] = move, steps, left
+        return True
+
+    def _moves(self, state):
+        """Generate moves of position: kings first, then pairs by count of
+        pyramid cards and lower rows first, then draw (None)."""
+        moves = sorted(state.moves(faces=self._rules.faces),
+                       key=lambda move: self._order(state, move))
+        yield from moves
+        if state.can_draw:
+            yield None
+
+    @staticmethod
+    def _order(state, move):
+        """Sort key of move: singles, more pyramid cards, lower rows."""
+        rows = [row_col(location[1])[0] for location in
+                map(state.locate, move) if location[0] == PYRAMID]
+        return len(move) != 1, -len(rows), -max(rows, default=-1)
+
+    def _evaluate(self, state):
+        """Return score of position: removed pyramid cards plus a quarter
+        for every open one."""
+        removed = sum(card_id == EMPTY for card_id in state.pyramid)
+        return removed + len(state.open_slots()) / 4
+
+    def _root(self, state, depth, deadline):
+        """Search all moves of root to depth.
+        :return: (best move, its value); _NO_MOVES if there are none"""
+        best, best_value = _NO_MOVES, None
+        seen = {}
+        for move in self._moves(state):
+            value = self._child(state, move, depth - 1, deadline, seen)
+            if best_value is None or value > best_value:
+                best, best_value = move, value
+        return best, best_value
+
+    def _child(self, state, move, depth, deadline, seen):
+        """Return value of position after move searched to depth."""
+        self.nodes += 1
+        if perf_counter() > deadline:
+            raise _Timeout
+        if move is None:
+            recycled = not state.stock_size
+            state.draw()
+        else:
+            undo = [(card_id,) + state.remove(card_id) for card_id in move]
+        try:
+            if move is not None and self._detector.is_dead(state, move):
+                return _DEAD
+            return self._value(state, depth, deadline, seen)
+        finally:
+            if move is None:
+                state.undo_draw(recycled)
+            else:
+                for card_id, zone, pos in reversed(undo):
+                    state.restore(card_id, zone, pos)
+
+    def _value(self, state, depth, deadline, seen):
+        """Return value of position searched to depth, positions searched
+        as deep are taken from seen."""
+        if state.won:
+            return _WON
+        key = state.hash, state.passes
+        known = seen.get(key)
+        if known is not None and known[0] >= depth:
+            return known[1]
+        value = self._evaluate(state)
+        if depth:
+            for move in self._moves(state):
+                value = max(value, self._child(state, move, depth - 1,
+                                               deadline, seen))
+                if value >= _WON:
+                    break
+        seen[key] = depth, value
+        return value
+
+
+def advise(game_logic, budget=0.02, cache=None):
+    """Return Advice of position of GameLogic object, see
+    Advisor.advise."""
+    return Advisor.of_game(game_logic, cache=cache).advise(game_logic.state,
+                                                          budget)
+
+
+def test():
+    # ---------------- Test ----------------
+    from engine import Engine
+    for level in ('easy', 'hard'):
+        worst = 0.0
+        for seed in range(20):
+            engine = Engine(level=level, seed=seed)
+            start = perf_counter()
+            advice = advise(engine.game_logic, 0.02)
+            worst = max(worst, perf_counter() - start)
+        print(level, advice, 'worst ms: {:.1f}'.format(worst * 1000))
+
+
+if __name__ == '__main__':
+    test()
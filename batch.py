@@ -0,0 +1,351 @@
+from deck import np, generate_deals, split_deals
+from rules import RuleSet, rule_set
+from state import EMPTY, FACES, TARGET, row_col, slot
+from time import perf_counter
+
+CLOSED = -2  # observation of covered pyramid card
+DRAW = 0  # action of drawing a card
+ILLEGAL = -1  # reward of illegal action, the game is not changed
+NO_KEY, NO_PARTNER = 1000, -1000  # pair keys of not playable positions
+
+
+class BatchEnv:
+    """Many pyramid games as stacked NumPy arrays, stepped at once.
+
+    Every game has pyramid slots (card id, EMPTY for removed cards) and
+    stock and waste as stacks with sizes, top card is last; recycling
+    copies the waste to the stock like GameState: the first card drawn is
+    the previous waste top. Open cards are derived from the pyramid: a
+    card is open if both cards covering it are removed. Arrays are
+    (size, count), games are the last axis, so every rule check works on
+    contiguous rows of all games. Open cards and keys of positions are
+    computed once after every change by reset or step, so the arrays are
+    changed only by them.
+
+    Positions of playable cards are pyramid slots 0...P-1 and the waste
+    top P. Actions are DRAW, then removal of one position (in position
+    order), then removal of two positions (a < b in lexicographic order),
+    see action and positions. step checks rules of all games in one
+    vectorized pass of keys of cards from the rule set of their level and
+    open cards.
+    """
+
+    def __init__(self, count, level='easy', deck_count=1, rows=7,
+                 target=TARGET, aces_high=False, max_passes=None, seed=None,
+                 rules=None):
+        """
+        Initializing class.
+        :param count: count of games
+        :param level: 'easy', 'hard' or sequence of levels of games
+        :param deck_count: count of decks of every game
+        :param rows: count of pyramid rows
+        :param target: sum of values of removed cards
+        :param aces_high: ace value is 14
+        :param max_passes: passes through the stock, None - unlimited
+        :param seed: seed of deals, None - random deals
+        :param rules: RuleSet used instead of target and ace value, games
+                      of every level use RuleSet.of_level of it
+        pyramid, stock, waste - card ids, (size, count) arrays;
+        stock_size, waste_size, passes - (count,) arrays;
+        hard - suits must be equal in a game, (count,) array
+        _known - (open cards, keys) of current positions, None - not
+        computed yet
+        """
+        if np is None:
+            raise ImportError('BatchEnv needs numpy')
+        levels = [level] * count if isinstance(level, str) else list(level)
+        assert count > 0 and len(levels) == count, 'incorrect count'
+        assert all(level_ in ('easy', 'hard') for level_ in levels), \
+            'incorrect level'
+        assert max_passes is None or max_passes > 0, 'incorrect pass limit'
+        assert rules is None or isinstance(rules, RuleSet), \
+            'incorrect RuleSet object'
+        if rules is None:
+            rules = rule_set('easy', target, aces_high)
+
+        self._count = count
+        self._deck_count = deck_count
+        self._rows = rows
+        self._max_passes = max_passes
+        self._seeds = np.random.SeedSequence(seed)
+        self._games = np.arange(count)
+        size = rows * (rows + 1) // 2
+        self._size = size
+        deck_size = FACES * deck_count
+        assert size < deck_size, 'deck is too small for pyramid'
+        # keys of every card id of easy, then of hard games, see _keys;
+        # card EMPTY is the last one of every level
+        keys, partners, singles = [], [], []
+        for level_ in ('easy', 'hard'):
+            face_keys = _face_keys(rules.of_level(level_))
+            for card_id in range(deck_size):
+                key, partner, single = face_keys[card_id % FACES]
+                keys.append(key)
+                partners.append(partner)
+                singles.append(single)
+            keys.append(NO_KEY)
+            partners.append(NO_PARTNER)
+            singles.append(False)
+        self._key_table = np.array(keys, dtype=np.int16)
+        self._partner_table = np.array(partners, dtype=np.int16)
+        self._single_table = np.array(singles, dtype=bool)
+        self._faces = np.array([card_id % FACES
+                                for card_id in range(deck_size)] + [EMPTY],
+                               dtype=np.int16)
+        # covering slots of every slot, slot size is never present
+        children = np.full((size, 2), size, dtype=np.intp)
+        for slot_ in range(size):
+            row, col = row_col(slot_)
+            if row + 1 < rows:
+                children[slot_] = slot(row + 1, col), slot(row + 1, col + 1)
+        self._children = children
+        # positions of actions, -1 - no second card
+        singles = list(range(size + 1))
+        pairs = [(a, b) for a in range(size + 1) for b in range(a + 1,
+                                                                size + 1)]
+        self._first = np.array([-1] + singles + [a for a, b in pairs],
+                               dtype=np.intp)
+        self._second = np.array([-1] * (len(singles) + 1) +
+                                [b for a, b in pairs], dtype=np.intp)
+
+        self.pyramid = np.empty((size, count), dtype=np.int16)
+        self.stock = np.empty((deck_size - size, count), dtype=np.int16)
+        self.waste = np.empty((deck_size - size, count), dtype=np.int16)
+        self.stock_size = np.empty(count, dtype=np.intp)
+        self.waste_size = np.empty(count, dtype=np.intp)
+        self.passes = np.empty(count, dtype=np.intp)
+        self.hard = np.array([level_ == 'hard' for level_ in levels])
+        # offset of key tables of every game
+        self._tables = np.where(self.hard, deck_size + 1, 0)
+        self._known = None
+        self.reset()
+
+    def __len__(self):
+        """Count of games."""
+        return self._count
+
+    @property
+    def action_count(self):
+        """Return count of actions."""
+        return len(self._first)
+
+    def action(self, *positions):
+        """Return action of removal of positions, DRAW if no positions."""
+        if not positions:
+            return DRAW
+        size = self._size + 1
+        if len(positions) == 1:
+            return 1 + positions[0]
+        a, b = sorted(positions)
+        assert a != b, 'the same position twice'
+        # pairs before (a, b): rows 0...a-1 of the upper triangle
+        return 1 + size + a * (2 * size - a - 1) // 2 + b - a - 1
+
+    def positions(self, action):
+        """Return tuple of positions removed by action, () for DRAW."""
+        return tuple(int(pos) for pos in
+                     (self._first[action], self._second[action]) if pos >= 0)
+
+    def reset(self, games=None):
+        """Deal new games.
+        :param games: bool mask or indexes of games, None - all games
+        :return: observation, see observation"""
+        index = self._games if games is None else \
+            np.flatnonzero(games) if np.asarray(games).dtype == bool else \
+            np.asarray(games, dtype=np.intp)
+        if len(index):
+            deals = generate_deals(len(index), self._deck_count,
+                                   self._seeds.spawn(1)[0])
+            pyramid, stock = split_deals(deals, self._rows)
+            self.pyramid[:, index] = pyramid.T
+            self.stock[:, index] = stock.T
+            self.stock_size[index] = stock.shape[1]
+            self.waste_size[index] = 0
+            self.passes[index] = 1
+            # open first extra card
+            self._draw(index)
+            self._known = None
+        return self.observation()
+
+    def _waste_top(self):
+        """Return (count,) card ids of waste top, EMPTY if waste is
+        empty."""
+        top = self.waste[np.maximum(self.waste_size - 1, 0), self._games]
+        return np.where(self.waste_size > 0, top, EMPTY)
+
+    def _open(self):
+        """Return (P, count) bool array of open pyramid cards."""
+        present = np.zeros((self._size + 1, self._count), dtype=bool)
+        np.not_equal(self.pyramid, EMPTY, out=present[:self._size])
+        return present[:self._size] & \
+            ~present[self._children[:, 0]] & ~present[self._children[:, 1]]
+
+    def _can_draw(self):
+        """Return (count,) bool array of games where a card can be
+        drawn."""
+        can_draw = self.stock_size > 0
+        if self._max_passes is None:
+            return can_draw | (self.waste_size > 0)
+        return can_draw | (self.waste_size > 0) & \
+            (self.passes < self._max_passes)
+
+    def _position(self):
+        """Return (open cards, keys, partner keys, singles) of current
+        positions, see _open and _keys."""
+        if self._known is None:
+            open_ = self._open()
+            self._known = (open_,) + self._keys(open_)
+        return self._known
+
+    def _keys(self, open_):
+        """Return (keys, partner keys, singles), (P + 1, count) arrays of
+        positions. Two cards are removed together if key of one is
+        partner key of the other, see _face_keys. Keys of not playable
+        positions never match. singles - playable card removed alone.
+        :param open_: open pyramid cards, see _open"""
+        index = np.empty((self._size + 1, self._count), dtype=np.intp)
+        index[:self._size] = self.pyramid
+        index[self._size] = self.waste[np.maximum(self.waste_size - 1, 0),
+                                       self._games]
+        index += self._tables
+        # not playable positions are card EMPTY of easy games, its keys
+        # never match in both levels
+        empty = len(self._faces) - 1
+        np.copyto(index[:self._size], empty, where=~open_)
+        np.copyto(index[self._size], empty, where=self.waste_size == 0)
+        return (self._key_table.take(index, mode='clip'),
+                self._partner_table.take(index, mode='clip'),
+                self._single_table.take(index, mode='clip'))
+
+    def legal_mask(self):
+        """Return (count, action_count) bool array of legal actions, it is
+        a view of (action_count, count) array."""
+        _, keys, partners, singles = self._position()
+        mask = np.empty((self.action_count, self._count), dtype=bool)
+        mask[0] = self._can_draw()
+        positions = self._size + 1
+        mask[1:positions + 1] = singles
+        # pairs of the first position a are contiguous rows
+        offset = positions + 1
+        for a in range(positions - 1):
+            count = positions - 1 - a
+            np.equal(keys[a], partners[a + 1:],
+                     out=mask[offset:offset + count])
+            offset += count
+        return mask.T
+
+    def _legal(self, actions):
+        """Return (count,) bool array of legal actions of games."""
+        first = self._first[actions]
+        second = self._second[actions]
+        _, keys, partners, singles = self._position()
+        games = self._games
+        pairs = keys[first, games] == partners[second, games]
+        return np.where(actions == DRAW, self._can_draw(),
+                        np.where(second < 0, singles[first, games], pairs))
+
+    def observation(self):
+        """Return (count, P + 3) int16 array: face of open pyramid cards,
+        CLOSED for covered and EMPTY for removed ones; face of waste top
+        or EMPTY; stock size; waste size. It is a view of (P + 3, count)
+        array."""
+        obs = np.empty((self._size + 3, self._count), dtype=np.int16)
+        # face table maps EMPTY (-1) to EMPTY
+        faces = self._faces.take(self.pyramid)
+        obs[:self._size] = np.where(self._position()[0] | (faces == EMPTY),
+                                    faces, CLOSED)
+        obs[self._size] = self._faces.take(self._waste_top())
+        obs[self._size + 1] = self.stock_size
+        obs[self._size + 2] = self.waste_size
+        return obs.T
+
+    @property
+    def won(self):
+        """Return (count,) bool array of cleared pyramids."""
+        return (self.pyramid == EMPTY).all(axis=0)
+
+    def _draw(self, index):
+        """Draw card in games of index, recycle empty stocks."""
+        recycle = index[self.stock_size[index] == 0]
+        if len(recycle):
+            self.stock[:, recycle] = self.waste[:, recycle]
+            self.stock_size[recycle] = self.waste_size[recycle]
+            self.waste_size[recycle] = 0
+            self.passes[recycle] += 1
+        self.stock_size[index] -= 1
+        self.waste[self.waste_size[index], index] = \
+            self.stock[self.stock_size[index], index]
+        self.waste_size[index] += 1
+
+    def step(self, actions):
+        """Apply one action in every game.
+        :param actions: (count,) int array of actions
+        :return: (observation, legal mask, rewards, done); reward is count
+                 of removed pyramid cards or ILLEGAL for illegal action
+                 which does not change the game, done - game is won or
+                 has no legal actions"""
+        actions = np.asarray(actions, dtype=np.intp)
+        legal = self._legal(actions)
+        rewards = np.where(legal, 0, ILLEGAL).astype(np.int16)
+
+        self._draw(np.flatnonzero(legal & (actions == DRAW)))
+        index = np.flatnonzero(legal & (actions != DRAW))
+        waste_top = self._size
+        for pos in (self._first[actions[index]],
+                    self._second[actions[index]]):
+            pyramid = (pos >= 0) & (pos < waste_top)
+            self.pyramid[pos[pyramid], index[pyramid]] = EMPTY
+            rewards[index[pyramid]] += 1
+            self.waste_size[index[pos == waste_top]] -= 1
+        self._known = None
+
+        mask = self.legal_mask()
+        done = self.won | ~mask.T.any(axis=0)
+        return self.observation(), mask, rewards, done
+
+
+def _face_keys(rules):
+    """Return (key, partner key, removed alone) of every face of RuleSet.
+    Key is the first face with the same partners, partner key is the key
+    of its partners, so two faces are removed together if key of one is
+    partner key of the other; NO_PARTNER if there are no partners."""
+    first = {}
+    keys = [first.setdefault(partners, face)
+            for face, partners in enumerate(rules.partners)]
+    res = []
+    for face, partners in enumerate(rules.partners):
+        partner_keys = set(keys[other] for other in partners)
+        assert len(partner_keys) <= 1, \
+            'rules cannot be compiled to keys of faces'
+        res.append((keys[face], partner_keys.pop() if partner_keys else
+                    NO_PARTNER, rules.removable(face)))
+    return res
+
+
+def test():
+    # ---------------- Test ----------------
+    env = BatchEnv(4096, level=['easy', 'hard'] * 2048, seed=1)
+    mask = env.legal_mask().T
+    steps = 0
+    won = 0
+    seconds = 0.0  # time of env calls, the policy is not counted
+    for _ in range(200):
+        # the first removal like the '?' hint, else draw
+        can_remove = mask[1:].any(axis=0)
+        actions = np.where(can_remove, mask[1:].argmax(axis=0) + 1, DRAW)
+        start = perf_counter()
+        obs, mask, rewards, done = env.step(actions)
+        seconds += perf_counter() - start
+        mask = mask.T
+        steps += len(env)
+        won += int(env.won.sum())
+        if done.any():
+            start = perf_counter()
+            env.reset(done)
+            mask = env.legal_mask().T
+            seconds += perf_counter() - start
+    print('steps per second: {:.0f}, won: {}'.format(steps / seconds, won))
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,285 @@
+from deck import DeckGenerator, unrank_deal
+from logic import TableCard, GameLogic
+from engine import Engine
+from dead import Detector
+from time import perf_counter
+import argparse
+import json
+import platform
+import sys
+
+DECK_COUNTS = (1, 2, 4)
+
+
+def _play_by_hints(engine):
+    """Play current game of engine by hints until it is won or stuck.
+    :return: count of engine steps"""
+    state = engine.game_logic.state
+    steps = 0
+    idle = 0  # draws since last removed card
+    while not engine.won and idle <= state.stock_size + state.waste_size:
+        hint = engine.hint()
+        if hint is None:
+            engine.step('n')
+            idle += 1
+        else:
+            engine.step('c', *hint.split())
+            idle = 0
+        steps += 1
+    return steps
+
+
+def _shuffled_decks(deck_count, number):
+    """Return number DeckGenerator objects shuffled by seeds 0..."""
+    decks = []
+    for seed in range(number):
+        deck = DeckGenerator(deck_count)
+        deck.shuffle(seed)
+        decks.append(deck)
+    return decks
+
+
+def _games(deck_count, number):
+    """Return number GameLogic objects of seeded deals with first extra
+    card open."""
+    games = []
+    for deck in _shuffled_decks(deck_count, number):
+        table = TableCard(deck)
+        table.generate_pyramid()
+        game_logic = GameLogic(table)
+        game_logic.card_from_additional_deck
+        games.append(game_logic)
+    return games
+
+
+# Every case prepares its data, times `number` operations and returns
+# (seconds, count of timed operations).
+
+def bench_deck(deck_count, number):
+    """DeckGenerator construction."""
+    start = perf_counter()
+    for _ in range(number):
+        DeckGenerator(deck_count)
+    return perf_counter() - start, number
+
+
+def bench_shuffle(deck_count, number):
+    """Seeded DeckGenerator.shuffle."""
+    deck = DeckGenerator(deck_count)
+    start = perf_counter()
+    for seed in range(number):
+        deck.shuffle(seed)
+    return perf_counter() - start, number
+
+
+def bench_unrank(deck_count, number):
+    """unrank_deal of 64-bit deal ids."""
+    start = perf_counter()
+    for deal_id in range(1 << 63, (1 << 63) + number):
+        unrank_deal(deal_id, deck_count)
+    return perf_counter() - start, number
+
+
+def bench_pyramid(deck_count, number):
+    """TableCard.generate_pyramid of shuffled deck."""
+    tables = [TableCard(deck) for deck in _shuffled_decks(deck_count, number)]
+    start = perf_counter()
+    for table in tables:
+        table.generate_pyramid()
+    return perf_counter() - start, number
+
+
+def bench_compare(deck_count, number):
+    """GameLogic.compare_card of a legal move, rules check and removal."""
+    moves = []
+    for game_logic in _games(deck_count, number):
+        for move in game_logic.legal_moves():
+            moves.append((game_logic, move))
+            break
+    start = perf_counter()
+    for game_logic, move in moves:
+        game_logic.compare_card(*move)
+    return perf_counter() - start, len(moves)
+
+
+def bench_exposure(deck_count, number):
+    """Removal and restore of open pyramid card: cover counts, open slots
+    and playable buckets."""
+    state = _games(deck_count, 1)[0].state
+    card_ids = [state.pyramid[slot] for slot in state.open_slots()]
+    rounds = number // len(card_ids) + 1
+    start = perf_counter()
+    for _ in range(rounds):
+        for card_id in card_ids:
+            zone, pos = state.remove(card_id)
+            state.restore(card_id, zone, pos)
+    return perf_counter() - start, rounds * len(card_ids)
+
+
+def bench_dead(deck_count, number):
+    """Detector.is_dead of seeded deals, all pyramid cards checked."""
+    detector = Detector()
+    states = [game_logic.state for game_logic in _games(deck_count, number)]
+    start = perf_counter()
+    for state in states:
+        detector.is_dead(state)
+    return perf_counter() - start, number
+
+
+def bench_hint(deck_count, number):
+    """Engine.hint of the position after first moves of seeded games."""
+    engines = []
+    for seed in range(min(number, 100)):
+        engine = Engine(deck_count=deck_count, seed=seed)
+        for _ in range(5):
+            hint = engine.hint()
+            if hint is None:
+                engine.step('n')
+            else:
+                engine.step('c', *hint.split())
+        engines.append(engine)
+    rounds = number // len(engines) + 1
+    start = perf_counter()
+    for _ in range(rounds):
+        for engine in engines:
+            engine.hint()
+    return perf_counter() - start, rounds * len(engines)
+
+
+def bench_draw(deck_count, number):
+    """card_from_additional_deck, stock passes included."""
+    game_logic = _games(deck_count, 1)[0]
+    start = perf_counter()
+    for _ in range(number):
+        game_logic.card_from_additional_deck
+    return perf_counter() - start, number
+
+
+def bench_undo(deck_count, number):
+    """Undo of played moves through redo_changes."""
+    games = []
+    moves = 0
+    seed = 0
+    while moves < number:
+        engine = Engine(deck_count=deck_count, seed=seed)
+        _play_by_hints(engine)
+        games.append(engine.game_logic)
+        moves += engine.game_logic.journal.move
+        seed += 1
+    start = perf_counter()
+    for game_logic in games:
+        while game_logic.journal.can_undo:
+            game_logic.redo_changes()
+    return perf_counter() - start, moves
+
+
+def bench_fork(deck_count, number):
+    """GameLogic.fork of a played game."""
+    engine = Engine(deck_count=deck_count, seed=0)
+    _play_by_hints(engine)
+    game_logic = engine.game_logic
+    start = perf_counter()
+    for _ in range(number):
+        game_logic.fork()
+    return perf_counter() - start, number
+
+
+def bench_game(deck_count, number):
+    """Engine steps of games played by hints."""
+    engine = Engine(deck_count=deck_count, seed=0)
+    steps = 0
+    seed = 0
+    start = perf_counter()
+    while steps < number:
+        engine.new_game(seed=seed)
+        steps += _play_by_hints(engine)
+        seed += 1
+    return perf_counter() - start, steps
+
+
+CASES = {'deck': bench_deck, 'shuffle': bench_shuffle,
+         'unrank': bench_unrank, 'pyramid': bench_pyramid,
+         'compare': bench_compare, 'exposure': bench_exposure,
+         'dead': bench_dead, 'hint': bench_hint, 'draw': bench_draw,
+         'undo': bench_undo, 'fork': bench_fork, 'game': bench_game}
+
+
+def run(cases=None, deck_counts=DECK_COUNTS, number=2000, repeat=5):
+    """Run benchmark cases.
+    :param cases: names of CASES, None - all
+    :param number: operations of one run
+    :param repeat: runs of every case, the fastest one is taken
+    :return: dict case -> {deck count (str): nanoseconds per operation}"""
+    res = {}
+    for name in cases or CASES:
+        res[name] = {}
+        for deck_count in deck_counts:
+            best = None
+            for _ in range(repeat):
+                seconds, count = CASES[name](deck_count, number)
+                per_op = seconds / count * 1e9
+                if best is None or per_op < best:
+                    best = per_op
+            res[name][str(deck_count)] = round(best, 1)
+    return res
+
+
+def compare(results, baseline, threshold=0.1):
+    """Return list of (case, deck count, baseline ns, result ns) which are
+    slower than baseline by more than threshold share."""
+    regressions = []
+    for name, values in results.items():
+        for deck_count, value in values.items():
+            base = baseline.get(name, {}).get(deck_count)
+            if base is not None and value > base * (1 + threshold):
+                regressions.append((name, deck_count, base, value))
+    return regressions
+
+
+def main(argv=None):
+    """Command line: run benchmarks, write JSON and check baseline.
+    :return: exit code, 1 if there are regressions"""
+    parser = argparse.ArgumentParser(description='Pyramid benchmarks')
+    parser.add_argument('cases', nargs='*',
+                        help='cases to run, default all: ' + ' '.join(CASES))
+    parser.add_argument('--decks', type=int, nargs='+', default=DECK_COUNTS)
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', help='write results JSON to file')
+    parser.add_argument('--baseline', help='results JSON to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='allowed slowdown share, default 0.1')
+    args = parser.parse_args(argv)
+    for name in args.cases:
+        if name not in CASES:
+            parser.error('unknown case: ' + name)
+
+    results = run(args.cases, args.decks, args.number, args.repeat)
+    report = {'python': platform.python_version(),
+              'machine': platform.machine(),
+              'number': args.number, 'repeat': args.repeat,
+              'results': results}
+    for name, values in results.items():
+        print('{:>9} '.format(name) + '  '.join(
+            'decks={} {:>10.0f} ns'.format(deck_count, value)
+            for deck_count, value in values.items()), file=sys.stderr)
+    if args.out:
+        with open(args.out, 'w') as file:
+            json.dump(report, file, indent=1)
+    else:
+        print(json.dumps(report))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for name, deck_count, base, value in regressions:
+            print('REGRESSION {} decks={}: {:.0f} -> {:.0f} ns (+{:.0%})'
+                  .format(name, deck_count, base, value, value / base - 1),
+                  file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+from state import EMPTY, TARGET
+from collections import OrderedDict, namedtuple
+from time import time_ns
+import sqlite3
+
+LOST = 0
+WON = 1
+
+# result of position: WON or LOST, first move of solution (tuple of card
+# ids, None - draw), moves to won game; move and distance of LOST are None
+Entry = namedtuple('Entry', 'result move distance')
+
+_SCHEMA = '''CREATE TABLE IF NOT EXISTS positions (
+    hash INTEGER NOT NULL,
+    rules INTEGER NOT NULL,
+    result INTEGER NOT NULL,
+    card1 INTEGER NOT NULL,
+    card2 INTEGER NOT NULL,
+    distance INTEGER NOT NULL,
+    stamp INTEGER NOT NULL,
+    PRIMARY KEY (hash, rules)) WITHOUT ROWID'''
+_STAMP_INDEX = '''CREATE INDEX IF NOT EXISTS positions_stamp
+    ON positions (stamp)'''
+
+
+def position_key(state, level='easy', target=TARGET, aces_high=False):
+    """Return cache key of position: (Zobrist hash, rules).
+    Rules are level, target, ace value and passes left under pass limit,
+    the hash is stored as signed 64-bit integer of SQLite."""
+    passes_left = 0 if state.max_passes is None else \
+        state.max_passes - state.passes + 1
+    rules = (passes_left << 8 | target) << 2 | \
+        (level == 'hard') << 1 | bool(aces_high)
+    hash_ = state.hash
+    return hash_ - (1 << 64) if hash_ >= 1 << 63 else hash_, rules
+
+
+def game_key(game_logic):
+    """Return cache key of position of GameLogic object."""
+    return position_key(game_logic.state, game_logic.level,
+                        game_logic.target, game_logic.aces_high)
+
+
+class PositionCache:
+    """Solved positions in SQLite file with in-memory LRU front.
+
+    get looks in the LRU, then in pending writes, then in the file. put
+    goes to the LRU and pending writes, which are written in one
+    transaction every batch puts and by flush or close. The file is in
+    WAL mode, so worker processes read it while one of them writes;
+    every process opens its own PositionCache. Rows have a stamp of the
+    last write or read, stamps of read rows are written with puts or
+    every batch reads. With max_rows the least recently used rows are
+    deleted on flush once a row count kept by the process exceeds it.
+    """
+
+    def __init__(self, path, size=100000, batch=1000, max_rows=None):
+        """
+        Initializing class.
+        :param path: SQLite file, ':memory:' - not persistent
+        :param size: count of entries of the LRU front
+        :param batch: count of puts written in one transaction
+        :param max_rows: limit of rows in the file, None - no limit
+        hits, misses - lookups found and not found
+        """
+        assert size > 0 and batch > 0, 'incorrect size or batch'
+        assert max_rows is None or max_rows > 0, 'incorrect max_rows'
+
+        self._db = sqlite3.connect(path, timeout=30)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(_SCHEMA)
+        self._db.execute(_STAMP_INDEX)
+        self._db.commit()
+        self._lru = OrderedDict()
+        self._size = size
+        self._batch = batch
+        self._max_rows = max_rows
+        self._pending = {}  # key -> Entry of not written puts
+        self._touched = set()  # keys read from the file
+        # upper bound of rows: replaced rows and other writers are
+        # counted only when it exceeds max_rows
+        self._rows = None if max_rows is None else self._count()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """Count of rows in the file, pending writes included."""
+        self.flush()
+        return self._count()
+
+    def _count(self):
+        """Return count of rows in the file."""
+        return self._db.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+
+    def _remember(self, key, entry):
+        """Put entry to the LRU front."""
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        if len(self._lru) > self._size:
+            self._lru.popitem(last=False)
+
+    def get(self, key):
+        """Return Entry of position key or None."""
+        entry = self._lru.get(key)
+        if entry is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return entry
+        entry = self._pending.get(key)
+        if entry is None:
+            row = self._db.execute(
+                'SELECT result, card1, card2, distance FROM positions '
+                'WHERE hash = ? AND rules = ?', key).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            result, card1, card2, distance = row
+            move = tuple(card_id for card_id in (card1, card2)
+                         if card_id != EMPTY) or None
+            entry = Entry(result, move if result == WON else None,
+                          distance if result == WON else None)
+            self._touched.add(key)
+            if len(self._touched) >= self._batch:
+                self.flush()
+        self._remember(key, entry)
+        self.hits += 1
+        return entry
+
+    def put(self, key, result, move=None, distance=None):
+        """Store result of position key.
+        :param result: WON or LOST
+        :param move: first move of solution, tuple of card ids or None
+        :param distance: count of moves to won game"""
+        assert result in (WON, LOST), 'incorrect result'
+        assert move is None or 0 < len(move) <= 2, 'incorrect move'
+
+        entry = Entry(result, move, distance)
+        self._remember(key, entry)
+        self._pending[key] = entry
+        if len(self._pending) >= self._batch:
+            self.flush()
+
+    def flush(self):
+        """Write pending puts and stamps of read rows."""
+        if not self._pending and not self._touched:
+            return
+        stamp = time_ns()
+        rows = []
+        for (hash_, rules), (result, move, distance) in self._pending.items():
+            cards = tuple(move or ()) + (EMPTY, EMPTY)
+            rows.append((hash_, rules, result, cards[0], cards[1],
+                         EMPTY if distance is None else distance, stamp))
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO positions '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self._db.executemany(
+                'UPDATE positions SET stamp = ? WHERE hash = ? AND rules = ?',
+                [(stamp,) + key for key in self._touched])
+            if self._max_rows is not None:
+                self._rows += len(rows)
+                if self._rows > self._max_rows:
+                    self._evict()
+        self._pending.clear()
+        self._touched.clear()
+
+    def _evict(self):
+        """Delete rows older than the max_rows most recent stamps."""
+        self._rows = self._count()
+        if self._rows > self._max_rows:
+            self._rows -= self._db.execute(
+                'DELETE FROM positions WHERE stamp < ('
+                'SELECT stamp FROM positions ORDER BY stamp DESC '
+                'LIMIT 1 OFFSET ?)', (self._max_rows - 1,)).rowcount
+
+    def close(self):
+        """Write pending puts and close the file."""
+        self.flush()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def test():
+    # ---------------- Test ----------------
+    from engine import Engine
+    from solver import Solver
+    from time import perf_counter
+    cache = PositionCache(':memory:', size=1000, batch=100)
+    engine = Engine(seed=1, cache=cache)
+    solver = Solver(max_nodes=100000, cache=cache)
+    print(solver.solve(engine.game_logic.state)[0], len(cache))
+    start = perf_counter()
+    print(solver.solve(engine.game_logic.state)[0], solver.nodes,
+          perf_counter() - start)
+    steps = 0
+    while not engine.won and steps < 200:
+        hint = engine.hint()
+        engine.step('n') if hint is None else engine.step('c', *hint.split())
+        steps += 1
+    print(engine.won, steps, cache.hits, cache.misses)
+    cache.close()
+
+
+if __name__ == '__main__':
+    test()
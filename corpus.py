@@ -0,0 +1,375 @@
+from deck import Card, DeckGenerator, np, generate_deals
+from logic import TableCard, GameLogic
+from simulate import greedy, play
+from dead import Detector
+from solver import Solver
+from state import UNKNOWN
+from multiprocessing import Pool, cpu_count
+from array import array
+from functools import partial
+from random import Random
+import mmap
+import struct
+
+# deal file: header, then fixed-width records of card ids
+DEALS_MAGIC = b'PYRD'
+DEALS_HEADER = struct.Struct('<4sBBBBQ')  # magic, version, decks, rows,
+                                          # id size, count
+# index file: header, metadata records, bucket directory, buckets
+INDEX_MAGIC = b'PYRI'
+INDEX_HEADER = struct.Struct('<4sBBHQ')  # magic, version, levels,
+                                         # difficulties, count
+VERSION = 1
+
+LEVELS = ('easy', 'hard')
+DIFFICULTIES = 6  # 0 - unsolvable or unknown, 1 (easy) ... 5 (hard)
+# metadata of one level: solvable, min stock passes, cleared by greedy
+# player, difficulty
+META = struct.Struct('<BBBB')
+BUCKET = struct.Struct('<QQ')  # offset, count of deal numbers (uint32)
+
+
+def difficulty(solvable, cleared, pyramid_size=28):
+    """Return difficulty 1-5 of solvable deal from count of pyramid cards
+    cleared by greedy player, 0 if deal is not known to be solvable.
+    A deal the greedy player wins is 1, so higher difficulties need an
+    analyzer that proves deals solvable without the greedy player
+    winning them (see solver_analyzer)."""
+    if solvable != 1:
+        return 0
+    missed = pyramid_size - cleared
+    for level, limit in enumerate((0, 3, 6, 11), 1):
+        if missed <= limit:
+            return level
+    return 5
+
+
+def greedy_analyzer(table, level):
+    """Play deal with greedy player.
+    :return: (solvable, min stock passes, cleared pyramid cards); a won
+             game proves the deal solvable and its passes are an upper
+             bound, a lost one leaves both UNKNOWN unless dead.Detector
+             proves the deal unsolvable"""
+    game_logic = GameLogic(table)
+    game_logic.level = level
+    dead = Detector(level).is_dead(game_logic.state)
+    game_logic.card_from_additional_deck
+    won, cleared, removed, moves, passes = play(game_logic, greedy, None)
+    if won:
+        return 1, passes, cleared
+    return 0 if dead else UNKNOWN, UNKNOWN, cleared
+
+
+def solver_analyzer(table, level, max_nodes=200000):
+    """Prove deal with solver.Solver and play it with greedy player.
+    :return: (solvable, min stock passes, cleared pyramid cards by greedy
+             player); solvable is 1 or 0 if search finished, UNKNOWN if
+             node limit was reached, passes is the lower of both players'
+             passes of a won game"""
+    game_logic = GameLogic(table)
+    game_logic.level = level
+    game_logic.card_from_additional_deck
+    solver = Solver(level, max_nodes=max_nodes)
+    solvable = solver.solve(game_logic.state)[0]
+    won, cleared, removed, moves, passes = play(game_logic, greedy, None)
+    if solvable is None:
+        return UNKNOWN, UNKNOWN, cleared
+    if solvable:
+        passes = min(passes, solver.passes) if won else solver.passes
+        return 1, min(passes, UNKNOWN - 1), cleared
+    return 0, UNKNOWN, cleared
+
+
+def write_corpus(path, deals, deck_count=1, rows=7):
+    """Write deals to corpus file.
+    :param deals: iterable of card id sequences, or numpy array of
+                  generate_deals
+    :return: count of written deals"""
+    size = Card.FACES * deck_count
+    id_size = 1 if size <= 256 else 2
+    count = 0
+    with open(path, 'wb') as file:
+        file.write(DEALS_HEADER.pack(DEALS_MAGIC, VERSION, deck_count, rows,
+                                     id_size, 0))
+        if np is not None and isinstance(deals, np.ndarray):
+            assert deals.shape[1] == size, 'incorrect deals width'
+            file.write(deals.astype('<u{}'.format(id_size)).tobytes())
+            count = deals.shape[0]
+        else:
+            for deal in deals:
+                assert len(deal) == size, 'incorrect deal length'
+                file.write(array('BH'[id_size - 1], deal).tobytes())
+                count += 1
+        file.seek(0)
+        file.write(DEALS_HEADER.pack(DEALS_MAGIC, VERSION, deck_count, rows,
+                                     id_size, count))
+    return count
+
+
+def generate_corpus(path, count, deck_count=1, seed=0, rows=7,
+                    chunk=100000):
+    """Write count seeded random deals to corpus file, numpy is used when
+    it is installed."""
+    if np is not None:
+        seeds = np.random.SeedSequence(seed).spawn(
+            (count + chunk - 1) // chunk)
+
+        def deals():
+            for index, start in enumerate(range(0, count, chunk)):
+                yield from generate_deals(min(chunk, count - start),
+                                          deck_count, seeds[index])
+    else:
+        def deals():
+            for index in range(count):
+                deck = DeckGenerator(deck_count)
+                deck.shuffle(seed << 32 | index)
+                yield deck.deck
+    return write_corpus(path, deals(), deck_count, rows)
+
+
+class Corpus:
+    """Memory-mapped deal corpus, deal k is record at fixed offset."""
+
+    def __init__(self, path):
+        """
+        Initializing class.
+        :param path: corpus file path; index is read from path + '.idx'
+                     if it exists
+        """
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._deck_count, self._rows, self._id_size, \
+            self._count = DEALS_HEADER.unpack_from(self._mm)
+        assert magic == DEALS_MAGIC and version == VERSION, \
+            'incorrect corpus file'
+        self._deals = memoryview(self._mm)[DEALS_HEADER.size:].cast(
+            'BH'[self._id_size - 1])
+        try:
+            self._index = DealIndex(path + '.idx')
+        except FileNotFoundError:
+            self._index = None
+
+    def __len__(self):
+        """Count of deals."""
+        return self._count
+
+    def __getitem__(self, item):
+        """Return array of card ids of deal number item, top card is
+        last."""
+        if not 0 <= item < self._count:
+            raise IndexError('deal number out of range')
+        width = Card.FACES * self._deck_count
+        return array('h', self._deals[item * width:(item + 1) * width]
+                     .tolist())
+
+    @property
+    def deck_count(self):
+        """Return count of decks in every deal."""
+        return self._deck_count
+
+    @property
+    def rows(self):
+        """Return count of pyramid rows."""
+        return self._rows
+
+    @property
+    def index(self):
+        """Return DealIndex object or None."""
+        return self._index
+
+    def table(self, item):
+        """Return TableCard of deal number item."""
+        return TableCard.from_deal(self[item], self._rows)
+
+    def game(self, item, level='easy'):
+        """Return GameLogic of deal number item."""
+        game_logic = GameLogic(self.table(item))
+        game_logic.level = level
+        return game_logic
+
+    def random_deal(self, level='easy', difficulty_=None, rng=None):
+        """Return (deal number, TableCard) of random solvable deal from
+        index, difficulty_ None - any difficulty.
+        :raise ValueError: if index has no such deal"""
+        assert self._index is not None, 'corpus has no index'
+        item = self._index.choose(level, difficulty_, rng)
+        return item, self.table(item)
+
+    def close(self):
+        """Close memory map and file."""
+        if self._index is not None:
+            self._index.close()
+        self._deals.release()
+        self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _analyze_chunk(args):
+    """Pool worker: metadata records of deals from start to stop."""
+    path, start, stop, analyzer = args
+    res = bytearray()
+    with Corpus(path) as corpus:
+        pyramid_size = len(corpus.table(0).state.pyramid)
+        for item in range(start, stop):
+            for level in LEVELS:
+                solvable, passes, cleared = analyzer(corpus.table(item),
+                                                     level)
+                res += META.pack(solvable, passes, cleared,
+                                 difficulty(solvable, cleared, pyramid_size))
+    return start, bytes(res)
+
+
+def _store_chunks(metas, results):
+    """Copy analyzed chunks to metadata records."""
+    for start, res in results:
+        offset = start * META.size * len(LEVELS)
+        metas[offset:offset + len(res)] = res
+
+
+def build_index(path, analyzer=greedy_analyzer, workers=None, chunk=10000):
+    """Analyze every deal of corpus and write index file path + '.idx'.
+    :param analyzer: function(table, level) -> (solvable, min passes,
+                     cleared), values are 0-255, UNKNOWN if not known"""
+    with Corpus(path) as corpus:
+        count = len(corpus)
+    tasks = [(path, start, min(start + chunk, count), analyzer)
+             for start in range(0, count, chunk)]
+    metas = bytearray(META.size * len(LEVELS) * count)
+    workers = workers or cpu_count()
+    if workers == 1:
+        _store_chunks(metas, map(_analyze_chunk, tasks))
+    else:
+        with Pool(workers) as pool:
+            _store_chunks(metas, pool.imap_unordered(_analyze_chunk, tasks))
+
+    # solvable deal numbers of every (level, difficulty)
+    buckets = [[array('I') for _ in range(DIFFICULTIES)] for _ in LEVELS]
+    for item in range(count):
+        for level in range(len(LEVELS)):
+            offset = (item * len(LEVELS) + level) * META.size
+            difficulty_ = metas[offset + 3]
+            if difficulty_:
+                buckets[level][difficulty_].append(item)
+    with open(path + '.idx', 'wb') as file:
+        file.write(INDEX_HEADER.pack(INDEX_MAGIC, VERSION, len(LEVELS),
+                                     DIFFICULTIES, count))
+        file.write(metas)
+        offset = file.tell() + BUCKET.size * len(LEVELS) * DIFFICULTIES
+        for level_buckets in buckets:
+            for bucket in level_buckets:
+                file.write(BUCKET.pack(offset, len(bucket)))
+                offset += len(bucket) * bucket.itemsize
+        for level_buckets in buckets:
+            for bucket in level_buckets:
+                file.write(bucket.tobytes())
+
+
+class DealIndex:
+    """Memory-mapped metadata of corpus deals."""
+
+    def __init__(self, path):
+        """
+        Initializing class.
+        :param path: index file path
+        """
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, levels, difficulties, self._count = \
+            INDEX_HEADER.unpack_from(self._mm)
+        assert magic == INDEX_MAGIC and version == VERSION and \
+            levels == len(LEVELS) and difficulties == DIFFICULTIES, \
+            'incorrect index file'
+        directory = INDEX_HEADER.size + META.size * len(LEVELS) * self._count
+        view = memoryview(self._mm)
+        self._buckets = []
+        for level in range(len(LEVELS)):
+            level_buckets = []
+            for difficulty_ in range(DIFFICULTIES):
+                offset, count = BUCKET.unpack_from(
+                    self._mm, directory + (level * DIFFICULTIES +
+                                           difficulty_) * BUCKET.size)
+                level_buckets.append(view[offset:offset + 4 * count]
+                                     .cast('I'))
+            self._buckets.append(level_buckets)
+
+    def __len__(self):
+        """Count of deals."""
+        return self._count
+
+    def meta(self, item, level='easy'):
+        """Return metadata dict of deal number item."""
+        if not 0 <= item < self._count:
+            raise IndexError('deal number out of range')
+        solvable, passes, cleared, difficulty_ = META.unpack_from(
+            self._mm, INDEX_HEADER.size +
+            (item * len(LEVELS) + LEVELS.index(level)) * META.size)
+        return {'solvable': None if solvable == UNKNOWN else bool(solvable),
+                'min_passes': None if passes == UNKNOWN else passes,
+                'cleared': cleared, 'difficulty': difficulty_}
+
+    def count(self, level='easy', difficulty_=None):
+        """Return count of solvable deals of level and difficulty."""
+        buckets = self._buckets[LEVELS.index(level)]
+        if difficulty_ is None:
+            return sum(len(bucket) for bucket in buckets)
+        return len(buckets[difficulty_])
+
+    def choose(self, level='easy', difficulty_=None, rng=None):
+        """Return random solvable deal number of level and difficulty,
+        difficulty_ None - any difficulty.
+        :raise ValueError: if there is no such deal"""
+        rng = rng or Random()
+        buckets = self._buckets[LEVELS.index(level)]
+        if difficulty_ is not None:
+            assert 0 < difficulty_ < DIFFICULTIES, 'incorrect difficulty'
+            buckets = [buckets[difficulty_]]
+        count = sum(len(bucket) for bucket in buckets)
+        if not count:
+            raise ValueError('no solvable {} deal of difficulty {}'.format(
+                level, 'any' if difficulty_ is None else difficulty_))
+        index = rng.randrange(count)
+        for bucket in buckets:
+            if index < len(bucket):
+                return bucket[index]
+            index -= len(bucket)
+
+    def close(self):
+        """Close memory map and file."""
+        for level_buckets in self._buckets:
+            for bucket in level_buckets:
+                bucket.release()
+        self._mm.close()
+        self._file.close()
+
+
+def test():
+    # ---------------- Test ----------------
+    import os
+    import tempfile
+    path = os.path.join(tempfile.mkdtemp(), 'test.deals')
+    print(generate_corpus(path, 200))
+    build_index(path, workers=1)
+    with Corpus(path) as corpus:
+        print(len(corpus), corpus.index.meta(0), corpus.index.count())
+        item, table = corpus.random_deal('easy', 1, Random(1))
+        print(item, corpus.index.meta(item))
+    build_index(path, partial(solver_analyzer, max_nodes=20000), workers=1)
+    with Corpus(path) as corpus:
+        print([corpus.index.count('easy', difficulty_)
+               for difficulty_ in range(1, DIFFICULTIES)])
+        item, table = corpus.random_deal('easy', 3, Random(1))
+        print(item, corpus.index.meta(item))
+        try:
+            corpus.random_deal('hard', 3, Random(1))
+        except ValueError as error:
+            print(error)
+
+
+if __name__ == '__main__':
+    test()
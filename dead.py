@@ -0,0 +1,134 @@
+from deck import Card
+from state import EMPTY, FACES, PYRAMID, TARGET, parents, row_col, slot
+from rules import rule_set
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def blocked_slots(rows):
+    """Return for every pyramid slot the set of slots which are never
+    open together with it: slots it covers and slots covering it."""
+    size = rows * (rows + 1) // 2
+    above = []
+    for slot_ in range(size):
+        res = set()
+        for parent in parents(slot_):
+            res.add(parent)
+            res |= above[parent]
+        above.append(res)
+    below = [set() for _ in range(size)]
+    for slot_ in reversed(range(size)):
+        row, col = row_col(slot_)
+        if row + 1 < rows:
+            for child in (slot(row + 1, col), slot(row + 1, col + 1)):
+                below[slot_].add(child)
+                below[slot_] |= below[child]
+    return tuple(frozenset(a | b) for a, b in zip(above, below))
+
+
+class Detector:
+    """Static check of positions which cannot be won.
+
+    A pyramid card is dead if every card it can be removed with is
+    already removed or lies in the same line of the pyramid: covered by
+    it or covering it, so both are never open together. A position with
+    a dead card is lost whatever is played. No search is done: a full
+    check looks at partners of every pyramid card, the check after a move
+    only at pyramid cards which lost a partner, draws change nothing.
+    """
+
+    def __init__(self, level='easy', target=TARGET, aces_high=False,
+                 rules=None):
+        """
+        Initializing class.
+        :param level: 'easy' or 'hard' (pairs of the same suit)
+        :param target: sum of values of removed cards
+        :param aces_high: ace value is 14
+        :param rules: RuleSet used instead of level, target and ace value
+        """
+        if rules is None:
+            rules = rule_set(level, target, aces_high)
+        self._partners = rules.partners
+        self._singles = frozenset(rules.faces[0])
+
+    @classmethod
+    def of_game(cls, game_logic):
+        """Return detector of rules of GameLogic object."""
+        return cls(rules=game_logic.rules)
+
+    def _is_dead_card(self, state, slot_, card_id, blocked):
+        """Check if pyramid card of slot has no partner left which can be
+        open together with it."""
+        lines = blocked[slot_]
+        bound = state.id_bound
+        locate = state.locate
+        for face in self._partners[card_id % FACES]:
+            for other in range(face, bound, FACES):
+                location = locate(other)
+                if location is not None and other != card_id and \
+                        (location[0] != PYRAMID or location[1] not in lines):
+                    return False
+        return True
+
+    def _dead_slots(self, state):
+        """Generate (slot, card id) of dead pyramid cards."""
+        blocked = blocked_slots(state.rows)
+        singles = self._singles
+        for slot_, card_id in enumerate(state.pyramid):
+            if card_id != EMPTY and card_id % FACES not in singles and \
+                    self._is_dead_card(state, slot_, card_id, blocked):
+                yield slot_, card_id
+
+    def dead_cards(self, state):
+        """Return list of card ids of dead pyramid cards."""
+        return [card_id for slot_, card_id in self._dead_slots(state)]
+
+    def is_dead(self, state, removed=None):
+        """Check if position cannot be won.
+        :param removed: card ids removed by the last move, only pyramid
+                        cards which were their partners are checked;
+                        None - check all pyramid cards"""
+        if removed is None:
+            return next(self._dead_slots(state), None) is not None
+        blocked = blocked_slots(state.rows)
+        bound = state.id_bound
+        locate = state.locate
+        for card_id in removed:
+            for face in self._partners[card_id % FACES]:
+                for other in range(face, bound, FACES):
+                    location = locate(other)
+                    if location is not None and location[0] == PYRAMID and \
+                            self._is_dead_card(state, location[1], other,
+                                               blocked):
+                        return True
+        return False
+
+
+def dead_cards(game_logic):
+    """Return list of dead pyramid Card objects of GameLogic object."""
+    return [Card.from_id(card_id) for card_id in
+            Detector.of_game(game_logic).dead_cards(game_logic.state)]
+
+
+def test():
+    # ---------------- Test ----------------
+    from deck import DeckGenerator
+    from logic import TableCard
+    from time import perf_counter
+    for level in ('easy', 'hard'):
+        detector = Detector(level)
+        dead = 0
+        seconds = 0.0
+        for seed in range(1000):
+            deck = DeckGenerator()
+            deck.shuffle(seed)
+            table = TableCard(deck)
+            table.generate_pyramid()
+            start = perf_counter()
+            dead += detector.is_dead(table.state)
+            seconds += perf_counter() - start
+        print(level, 'dead deals:', dead, 'us per deal:', seconds * 1000)
+
+
+if __name__ == '__main__':
+    test()
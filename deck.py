@@ -1,129 +1,308 @@
-from random import shuffle
+from array import array
+from functools import lru_cache
+from math import factorial, gcd, isqrt
+from random import Random, shuffle
+from time import perf_counter
+
+try:
+    import numpy as np
+except ImportError:  # numpy is needed only for batch deals
+    np = None
 
 
 class Card:
-    """Card object class."""
+    """Card object class.
+
+    Cards are immutable and interned: there is one Card object per card id,
+    Card('K', 'H') always returns the same object. Card id is
+    deck_number * 52 + suit_index * 13 + rank_index.
+    """
 
     RANKS = ['A', '2', '3', '4', '5', '6', '7', '8', '9', '10', 'J', 'Q', 'K']
     # A - Ace; J - Jack; Q - Queen; K - King
     SUITS = ['S', 'D', 'C', 'H']
     # S - Shades; D - Diamonds; C - Clubs; H - Hearts
+    FACES = len(RANKS) * len(SUITS)
+
+    __slots__ = ('_rank', '_suit', '_value', '_id')
+    _cards = []  # interned cards, index is card id
 
-    def __init__(self, rank, suit, status=False):
+    def __new__(cls, rank, suit, deck_number=0):
         """
-        Initializing class.
+        Return interned card.
         :param rank: rank of card
         :param suit: suit of card
-        :param status: False - the face of card close, True - open
+        :param deck_number: number of deck for multi-deck games
         """
         assert isinstance(rank, str) and isinstance(suit, str) and isinstance(
-            status, bool), 'enter correct value'
-        assert rank in self.RANKS and suit in self.SUITS, 'entered incorrect' \
-                                                          ' rank or suit'
-        self._rank = rank
-        self._suit = suit
-        self._status = status
-        self._value = self.RANKS.index(rank) + 1  # set card value (1-13)
+            deck_number, int), 'enter correct value'
+        assert rank in cls.RANKS and suit in cls.SUITS, 'entered incorrect' \
+                                                        ' rank or suit'
+        assert deck_number >= 0, 'incorrect deck number'
+        return cls.from_id(deck_number * cls.FACES +
+                           cls.SUITS.index(suit) * len(cls.RANKS) +
+                           cls.RANKS.index(rank))
+
+    @classmethod
+    def from_id(cls, card_id):
+        """Return interned card by card id."""
+        cards = cls._cards
+        if card_id >= len(cards):
+            for new_id in range(len(cards), card_id + 1):
+                card = object.__new__(cls)
+                face = new_id % cls.FACES
+                object.__setattr__(card, '_rank',
+                                   cls.RANKS[face % len(cls.RANKS)])
+                object.__setattr__(card, '_suit',
+                                   cls.SUITS[face // len(cls.RANKS)])
+                object.__setattr__(card, '_value',
+                                   face % len(cls.RANKS) + 1)  # 1-13
+                object.__setattr__(card, '_id', new_id)
+                cards.append(card)
+        return cards[card_id]
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Card object is immutable')
+
+    def __reduce__(self):
+        """Keep cards interned after pickle and copy."""
+        return Card.from_id, (self._id,)
 
     @property
     def rank(self):
         """Return card rank."""
         return self._rank
 
-    @rank.setter
-    def rank(self, value):
-        """Set new card rank. Only None."""
-        assert value is None, 'you can set only None value'
-        self._rank = value
-
     @property
     def suit(self):
         """Return card suit."""
         return self._suit
 
-    @suit.setter
-    def suit(self, value):
-        """Set new card suit. Only None."""
-        assert value is None, 'you can set only None value'
-        self._suit = value
-
-    @property
-    def status(self):
-        """Return card status."""
-        return self._status
-
-    @status.setter
-    def status(self, value):
-        """Set new status value. Only bool."""
-        assert isinstance(value, bool), 'incorrect value'
-        self._status = value
-
     @property
     def value(self):
         """Return card value."""
         return self._value
 
+    @property
+    def id(self):
+        """Return card id."""
+        return self._id
+
+    @property
+    def face(self):
+        """Return card id in one deck (0-51)."""
+        return self._id % self.FACES
+
     def __str__(self):
-        return 'Card: Rank-{}; Suit-{}; Status-{}'\
-            .format(self._rank, self._suit, 'Open' if self._status else 'Close')
+        return 'Card: Rank-{}; Suit-{}'.format(self._rank, self._suit)
+
+    def __repr__(self):
+        return 'Card({!r}, {!r}, {})'.format(self._rank, self._suit,
+                                             self._id // self.FACES)
 
 
 class DeckGenerator:
     """Generate cards deck."""
 
-    def __init__(self, deck_count=1):
+    def __init__(self, deck_count=1, deal_id=None):
         """
         :param deck_count: count of decks
-        _deck - all cards on deck
-        _iter - iterator start position
+        :param deal_id: number of deal, see unrank_deal; None - sorted deck
+        _deck - card ids of all cards on deck, top card is last
         """
         assert isinstance(deck_count, int), 'must be integer'
         assert deck_count > 0, 'count must be bigger than 0'
 
-        self._deck = []
-        self._iter = 0
         self._deck_count = deck_count
-
         # fill the deck
-        for decks in range(self._deck_count):
-            for suit in Card.SUITS:
-                for rank in Card.RANKS:
-                    self._deck.append(Card(rank, suit))
+        self._deck = array('h', range(Card.FACES * deck_count)) \
+            if deal_id is None else unrank_deal(deal_id, deck_count)
 
     def __len__(self):
         """Deck length."""
         return len(self._deck)
 
     def __iter__(self):
-        return self
+        """Iterate over Card objects of deck."""
+        return map(Card.from_id, self._deck)
 
-    def __next__(self):
-        if self._iter < len(self._deck) - 1:
-            self._iter += 1
-            return self._deck[self._iter]
-        raise StopIteration
+    @classmethod
+    def from_deal(cls, deal):
+        """Return deck with cards in the order of deal.
+        :param deal: card ids, e.g. row of generate_deals array"""
+        if hasattr(deal, 'tolist'):
+            deal = deal.tolist()
+        assert len(deal) and len(deal) % Card.FACES == 0, \
+            'incorrect deal length'
+        deck = cls.__new__(cls)
+        deck._deck_count = len(deal) // Card.FACES
+        deck._deck = array('h', deal)
+        return deck
 
     @property
     def deck(self):
-        """Return deck list."""
+        """Return deck array of card ids."""
         return self._deck
 
-    def shuffle(self):
-        """Shuffle deck list."""
-        return shuffle(self._deck)
+    @property
+    def deck_count(self):
+        """Return count of decks."""
+        return self._deck_count
+
+    @property
+    def deal_id(self):
+        """Return number of deal of deck order, see rank_deal."""
+        return rank_deal(self._deck)
+
+    def shuffle(self, seed=None):
+        """Shuffle deck array in place.
+        :param seed: seed for reproducible shuffle, None - random"""
+        if seed is None:
+            return shuffle(self._deck)
+        return Random(seed).shuffle(self._deck)
+
+
+def deal_count(deck_count=1):
+    """Return count of deals: deal ids are 0...deal_count - 1. Copies of
+    a card in multi-deck games are different card ids."""
+    return factorial(Card.FACES * deck_count)
+
+
+@lru_cache(maxsize=None)
+def _deal_mix(size):
+    """Return (multiplier, its inverse) of deal ids of deck size modulo
+    count of deals: the first number coprime with it from count / golden
+    ratio, so consecutive ids give unlike deals."""
+    count = factorial(size)
+    mix = (isqrt(5 * count * count) - count) // 2
+    while gcd(mix, count) != 1:
+        mix += 1
+    return mix, pow(mix, -1, count)
+
+
+def unrank_deal(deal_id, deck_count=1):
+    """Return deal of number as array of card ids, top card is last.
+    Deal id times a multiplier modulo deal count is a mixed radix number:
+    its digit of radix n, n - 1, ..., 1 is the index of the next card
+    among cards not dealt yet. Without the multiplier 64-bit ids would
+    change only the first cards, deal 0 is the sorted deck. Any int below
+    deal_count is a deal.
+    :param deal_id: number of deal, 0...deal_count(deck_count) - 1
+    :param deck_count: count of decks"""
+    size = Card.FACES * deck_count
+    count = factorial(size)
+    assert isinstance(deal_id, int) and 0 <= deal_id < count, \
+        'incorrect deal id'
+    deal_id = deal_id * _deal_mix(size)[0] % count
+    cards = list(range(size))
+    deal = array('h')
+    for radix in range(size, 0, -1):
+        deal_id, index = divmod(deal_id, radix)
+        deal.append(cards.pop(index))
+    return deal
+
+
+def rank_deal(deal):
+    """Return number of deal, reverse of unrank_deal.
+    :param deal: card ids of all cards of whole decks, top card is last"""
+    if hasattr(deal, 'tolist'):
+        deal = deal.tolist()
+    size = len(deal)
+    assert size and size % Card.FACES == 0 and \
+        sorted(deal) == list(range(size)), 'incorrect deal'
+    cards = list(range(size))
+    indexes = []
+    for card_id in deal:
+        index = cards.index(card_id)
+        del cards[index]
+        indexes.append(index)
+    deal_id = 0
+    for radix, index in zip(range(1, size + 1), reversed(indexes)):
+        deal_id = deal_id * radix + index
+    return deal_id * _deal_mix(size)[1] % factorial(size)
+
+
+def generate_deals(count, deck_count=1, seed=None):
+    """Return count shuffled deals at once.
+    :param count: count of deals
+    :param deck_count: count of decks in every deal
+    :param seed: int or numpy SeedSequence, None - random deals
+    :return: numpy array (count, 52 * deck_count) of card ids, uint8 up to
+             4 decks, uint16 for more; top card is last like in DeckGenerator
+    """
+    if np is None:
+        raise ImportError('generate_deals needs numpy')
+    assert isinstance(count, int) and count >= 0, 'incorrect count'
+    assert isinstance(deck_count, int) and deck_count > 0, \
+        'count must be bigger than 0'
+
+    size = Card.FACES * deck_count
+    dtype = np.uint8 if size <= 256 else np.uint16
+    rng = np.random.default_rng(seed)
+    # Fisher-Yates shuffle of all deals at once, position by position;
+    # deals are columns, so every position is a contiguous row
+    deals = np.empty((size, count), dtype=dtype)
+    deals[:] = np.arange(size, dtype=dtype)[:, None]
+    flat = deals.reshape(-1)
+    games = np.arange(count, dtype=np.intp)
+    picks = np.empty(count, dtype=np.uint32)
+    index = np.empty(count, dtype=np.intp)
+    top = np.empty(count, dtype=dtype)
+    for pos in range(size - 1, 0, -1):
+        # uniform pick 0...pos: high half of 16 random bits * (pos + 1),
+        # low halves under 2 ** 16 % (pos + 1) are drawn again (Lemire)
+        bound = pos + 1
+        np.multiply(rng.integers(0, 1 << 16, count, dtype=np.uint16), bound,
+                    out=picks, dtype=np.uint32)
+        limit = (1 << 16) % bound
+        if limit:
+            again = np.flatnonzero(picks.astype(np.uint16) < limit)
+            while len(again):
+                picks[again] = rng.integers(0, 1 << 16, len(again),
+                                            dtype=np.uint16) * np.uint32(bound)
+                again = again[picks[again].astype(np.uint16) < limit]
+        np.right_shift(picks, 16, out=picks)
+        # swap card of pos with the picked one in every deal
+        np.multiply(picks, count, out=index, dtype=np.intp)
+        index += games
+        np.copyto(top, deals[pos])
+        flat.take(index, out=deals[pos])
+        flat.put(index, top)
+    return np.ascontiguousarray(deals.T)
+
+
+def split_deals(deals, rows=7):
+    """Return (pyramid, stock) views of deals array.
+    pyramid[:, k] is the card of pyramid slot k (row by row, like
+    TableCard.generate_pyramid deals it), stock keeps deck order."""
+    size = rows * (rows + 1) // 2
+    assert deals.shape[1] > size, 'deals are too small for pyramid'
+    return deals[:, ::-1][:, :size], deals[:, :deals.shape[1] - size]
 
 
 def test():
     # ---------------- Test ----------------
     d = DeckGenerator()
-    d.deck[0].status = True
-    print(d.deck[0])
+    print(Card.from_id(d.deck[0]))
     d.shuffle()
     print(len(d))
-    d.deck[0].rank = False
     c = Card('10', 'H')
-    c.status = True
+    print(c is Card('10', 'H'), c.id, repr(c))
+    d.shuffle(seed=1)
+    print(list(DeckGenerator.from_deal(d.deck)) == list(d))
+    deal = DeckGenerator(deal_id=123456789)
+    print(deal.deal_id, DeckGenerator(2, deal_id=deal_count(2) - 1).deal_id
+          == deal_count(2) - 1, d.deal_id.bit_length())
+    try:
+        c.rank = None
+    except AttributeError as e:
+        print(e)
+    if np is not None:
+        start = perf_counter()
+        deals = generate_deals(1000000, seed=1)
+        print('1M deals: {:.2f} s'.format(perf_counter() - start),
+              (np.sort(deals, axis=1) == np.arange(Card.FACES)).all())
 
 
 if __name__ == '__main__':
-    test()
\ No newline at end of file
+    test()
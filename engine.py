@@ -0,0 +1,310 @@
+from deck import Card, DeckGenerator, rank_deal
+from logic import TableCard, GameLogic
+from state import EMPTY, FACES, MAX_CARDS, TARGET, slot
+from cache import WON, game_key
+from advisor import Advisor
+from rules import RuleSet, rule_set
+from random import getrandbits
+from time import perf_counter
+
+
+# 'rank:suit' text of every face
+LABELS = tuple('{}:{}'.format(card.rank, card.suit)
+               for card in map(Card.from_id, range(FACES)))
+MAX_DECKS = MAX_CARDS // FACES  # card ids fit the journal records
+
+
+def check_table(deck_count, rows):
+    """Raise ValueError if a game of deck_count decks and rows pyramid
+    rows cannot be dealt."""
+    if type(deck_count) is not int or not 0 < deck_count <= MAX_DECKS:
+        raise ValueError('decks must be 1...{}'.format(MAX_DECKS))
+    if type(rows) is not int or rows <= 0:
+        raise ValueError('rows must be positive integer')
+    if slot(rows, 0) >= deck_count * FACES:
+        raise ValueError('too many pyramid rows for {} decks'
+                         .format(deck_count))
+
+
+class Engine:
+    """Headless pyramid game: command in, observation out.
+
+    No input, output or system calls, so it can run in servers, workers
+    and tests. Commands are the same as in the terminal game:
+    ng - new game, n - next extra card, c - compare, r - undo, y - redo,
+    ? - hint, lvl - new game of level.
+    """
+
+    COMMANDS = ('ng', 'n', 'c', 'r', 'y', '?', 'lvl')
+
+    def __init__(self, game_logic=None, level='easy', deck_count=1,
+                 seed=None, recorder=None, rows=7, target=TARGET,
+                 aces_high=False, max_passes=None, cache=None,
+                 hint_budget=None, deal_id=None, rules=None):
+        """
+        Initializing class.
+        :param game_logic: GameLogic object to continue, new games have
+                           its deck count and rows; None - new game
+        :param level: level of new games
+        :param deck_count: count of decks of new games
+        :param seed: deal seed of the first new game, None - random
+        :param recorder: replay.ReplayWriter for all games, None - no log
+        :param rows: count of pyramid rows of new games
+        :param target: sum of values of removed cards in new games
+        :param aces_high: ace value is 14 in new games
+        :param max_passes: passes through the stock in new games, None -
+        unlimited
+        :param cache: cache.PositionCache, hints of solved positions are
+                      moves of solution, None - no cache
+        :param hint_budget: seconds of search of a hint by advisor.Advisor,
+                            None - the first legal move
+        :param deal_id: number of the first new game deal, see
+                        deck.unrank_deal; used instead of seed
+        :param rules: RuleSet of new games used instead of level, target
+                      and ace value
+        """
+        assert game_logic is None or isinstance(game_logic, GameLogic), \
+            'incorrect GameLogic object'
+        assert rules is None or isinstance(rules, RuleSet), \
+            'incorrect RuleSet object'
+        if game_logic is None:
+            check_table(deck_count, rows)
+
+        self._rules = rule_set(level, target, aces_high) if rules is None \
+            else rules
+        self._deck_count = deck_count
+        self._rows = rows
+        self._max_passes = max_passes
+        self._recorder = recorder
+        self._cache = cache
+        self._hint_budget = hint_budget
+        self._advisor = None  # advisor.Advisor of hints
+        self._seed = None
+        self._deal = None  # card ids of deal of current game
+        if game_logic is None:
+            self.new_game(seed=seed, deal_id=deal_id)
+        else:
+            self._gl = game_logic
+            self._rules = game_logic.rules
+            deck = game_logic.table.additional_deck
+            self._deck_count = (game_logic.state.id_bound - 1) // FACES + 1 \
+                if deck is None else deck.deck_count
+            self._rows = game_logic.state.rows
+            self._max_passes = game_logic.max_passes
+            if recorder is not None:
+                recorder.attach(game_logic)
+            if game_logic.current_card is None:
+                # open first extra card
+                self._gl.card_from_additional_deck
+        self._handlers = {'ng': self._new_game, 'n': self._next,
+                          'c': self._compare, 'r': self._undo,
+                          'y': self._redo, '?': self._hint,
+                          'lvl': self._new_level}
+
+    def new_game(self, level=None, seed=None, deal_id=None):
+        """Deal new game.
+        :param level: game level, None - current level
+        :param seed: deal seed, None - random
+        :param deal_id: number of deal, see deck.unrank_deal; used instead
+                        of seed"""
+        if deal_id is not None:
+            seed = None
+            deck = DeckGenerator(self._deck_count, deal_id)
+        else:
+            if seed is None:
+                seed = getrandbits(63)
+            deck = DeckGenerator(self._deck_count)
+            deck.shuffle(seed)
+        self._deal = deck.deck[:]
+        table = TableCard(deck, self._rows)
+        table.generate_pyramid()
+        if level is not None:
+            self._rules = self._rules.of_level(level)
+        self._gl = GameLogic(table, max_passes=self._max_passes,
+                             rules=self._rules)
+        self._seed = seed
+        if self._recorder is not None:
+            self._recorder.attach(self._gl, seed, self._deck_count)
+        # open first extra card
+        self._gl.card_from_additional_deck
+
+    @property
+    def game_logic(self):
+        """Return GameLogic object of current game."""
+        return self._gl
+
+    @property
+    def seed(self):
+        """Return deal seed of current game, None if it is not known."""
+        return self._seed
+
+    @property
+    def deal_id(self):
+        """Return number of deal of current game, None if it is not
+        known."""
+        return None if self._deal is None else rank_deal(self._deal)
+
+    @property
+    def won(self):
+        """Check if pyramid is cleared."""
+        return self._gl.state.won
+
+    def open_cards(self):
+        """Return list of uncovered pyramid cards, index is card number."""
+        return self._gl.table.open_cards()
+
+    def hint(self):
+        """Return hint: 'x' - extra card, '0...n' - pyramid card, '1 5' or
+        'x 4' - two cards; None if there are no moves or the cached
+        solution or the advisor draws a card."""
+        metrics = self._gl.metrics
+        if metrics is None:
+            return self._hint_text()
+        start = perf_counter()
+        hint = self._hint_text()
+        metrics.since('hint', start)
+        return hint
+
+    def advice(self):
+        """Return advisor.Advice of position searched within hint budget,
+        None if there is no budget."""
+        if self._hint_budget is None:
+            return None
+        gl = self._gl
+        if self._advisor is None or self._advisor.rules is not gl.rules:
+            # advisor remembers proven lines of the game
+            self._advisor = Advisor.of_game(gl, cache=self._cache)
+        return self._advisor.advise(gl.state, self._hint_budget)
+
+    def _hint_text(self):
+        """Return hint of cached solution, of the advisor or the first legal
+        move, see hint."""
+        # index of every open card, additional card is 'x'
+        indexes = {card.id: str(index)
+                   for index, card in enumerate(self.open_cards())}
+        if self._gl.current_card is not None:
+            indexes[self._gl.current_card.id] = 'x'
+        if self._cache is not None:
+            entry = self._cache.get(game_key(self._gl))
+            if entry is not None and entry.result == WON:
+                if entry.move is None:
+                    return None  # solution draws next card
+                if all(card_id in indexes for card_id in entry.move):
+                    return self._hint_of(entry.move, indexes)
+        if self._hint_budget is not None:
+            move = self.advice().move
+            # None - advisor draws next card
+            return None if move is None else self._hint_of(move, indexes)
+        # legal moves come from the logic layer, kings first
+        for move in self._gl.legal_moves():
+            return self._hint_of([card.id for card in move], indexes)
+
+    @staticmethod
+    def _hint_of(card_ids, indexes):
+        """Return hint text of move, indexes are user indexes of cards."""
+        return ' '.join(sorted(
+            (indexes[card_id] for card_id in card_ids),
+            key=lambda index: -1 if index == 'x' else int(index)))
+
+    def _card(self, index, open_cards):
+        """Return Card object of user index: 'x' or number of open card."""
+        if index == 'x':
+            card = self._gl.current_card
+            if card is None:
+                raise ValueError('there is no extra card')
+            return card
+        if not index.isdigit() or int(index) >= len(open_cards):
+            raise ValueError('incorrect card index')
+        return open_cards[int(index)]
+
+    def _new_game(self):
+        self.new_game()
+
+    def _next(self):
+        if self._gl.card_from_additional_deck is None:
+            state = self._gl.state
+            if state.stock_size or state.waste_size:
+                raise ValueError('no more passes through the stock')
+
+    def _compare(self, *indexes):
+        if len(indexes) not in range(1, 3):
+            raise ValueError('enter one or two cards')
+        open_cards = self.open_cards()
+        self._gl.compare_card(*[self._card(index, open_cards)
+                                for index in indexes])
+
+    def _undo(self):
+        self._gl.undo()
+
+    def _redo(self):
+        self._gl.redo()
+
+    def _hint(self):
+        return {'hint': self.hint()}
+
+    def _new_level(self, level):
+        if level not in ('easy', 'hard'):
+            raise ValueError('incorrect level')
+        self.new_game(level)
+
+    def step(self, command, *args):
+        """Apply command and return observation.
+        :param command: one of COMMANDS
+        :param args: card indexes for 'c', level for 'lvl'
+        :return: observation dict, 'error' is message of rejected command"""
+        handler = self._handlers.get(command)
+        try:
+            if handler is None:
+                raise ValueError('unknown command')
+            extra = handler(*args)
+        except (ValueError, IndexError, AssertionError, TypeError) as e:
+            observation = self.observation()
+            observation['error'] = str(e) or type(e).__name__
+            return observation
+        observation = self.observation()
+        if extra:
+            observation.update(extra)
+        return observation
+
+    def observation(self):
+        """Return current position as dict of plain values.
+        pyramid - rows of 'rank:suit' for open, '#' for closed and None for
+        removed cards; open - open pyramid cards by index; extra - extra
+        card or None; stock, waste - count of cards; passes - number of
+        pass through the stock; passes_left - passes left with the current
+        one, None - unlimited."""
+        state = self._gl.state
+        cards = state.pyramid
+        # flat list of slots, then open cards are labelled
+        flat = ['#' if card_id != EMPTY else None for card_id in cards]
+        open_ = []
+        for slot_ in state.open_slots():
+            flat[slot_] = label = LABELS[cards[slot_] % FACES]
+            open_.append(label)
+        pyramid = [flat[row * (row + 1) // 2:(row + 1) * (row + 2) // 2]
+                   for row in range(state.rows)]
+        top = state.waste_top
+        return {'level': self._gl.level,
+                'pyramid': pyramid,
+                'open': open_,
+                'extra': None if top == EMPTY else LABELS[top % FACES],
+                'stock': state.stock_size,
+                'waste': state.waste_size,
+                'passes': state.passes,
+                'passes_left': None if state.max_passes is None else
+                state.max_passes - state.passes + 1,
+                'moves': self._gl.journal.move,
+                'won': state.won,
+                'error': None}
+
+
+def test():
+    # ---------------- Test ----------------
+    e = Engine(seed=1)
+    print(e.step('?'))
+    print(e.step('c', 'x', '0')['error'])
+    print(e.step('n')['extra'], e.step('r')['extra'])
+
+
+if __name__ == '__main__':
+    test()
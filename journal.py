@@ -0,0 +1,248 @@
+from array import array
+from state import GameState, EMPTY, MAX_CARDS
+
+# kinds of moves
+REMOVE = 0
+DRAW = 1
+
+# bits of packed card record: card id, zone, position
+_ID_BITS = 12
+_ZONE_BITS = 2
+_POS_BITS = 12
+_CARD_BITS = _ID_BITS + _ZONE_BITS + _POS_BITS
+_CARD_MASK = (1 << _CARD_BITS) - 1
+assert MAX_CARDS <= 1 << min(_ID_BITS, _POS_BITS), 'card record overflow'
+
+
+def _pack_card(card_id, zone, pos):
+    """Pack removed card record into int."""
+    return (card_id << _ZONE_BITS | zone) << _POS_BITS | pos
+
+
+def _unpack_card(record):
+    """Return (card id, zone, position) of packed card record."""
+    pos = record & (1 << _POS_BITS) - 1
+    record >>= _POS_BITS
+    return record >> _ZONE_BITS, record & (1 << _ZONE_BITS) - 1, pos
+
+
+class Journal:
+    """Undo/redo journal of moves on GameState.
+
+    Every move is one int: kind bit, then for DRAW a recycle flag, for
+    REMOVE count of cards and (card id, zone, position) of every removed
+    card. Undo and redo only move the cursor and apply one entry.
+    Open status of cards is derived from the state, so it is not stored.
+    """
+
+    def __init__(self, state, checkpoint=0, keep=0):
+        """
+        Initializing class.
+        :param state: GameState object
+        :param checkpoint: save copy of state every checkpoint moves,
+                           0 - no checkpoints
+        :param keep: count of kept checkpoints, moves before the oldest one
+                     are dropped and cannot be undone, 0 - keep all moves
+        _entries - packed moves, _entries[:_cursor] are applied
+        _base - number of move _entries[0]
+        _checkpoints - list of (move number, GameState copy)
+        _shared - _entries and _checkpoints are shared with a fork
+        """
+        assert isinstance(state, GameState), 'incorrect GameState object'
+        assert state.id_bound <= 1 << _ID_BITS and \
+            len(state.pyramid) <= 1 << _POS_BITS, 'too many cards'
+        assert isinstance(checkpoint, int) and checkpoint >= 0, \
+            'incorrect checkpoint value'
+        assert isinstance(keep, int) and keep >= 0, 'incorrect keep value'
+        assert checkpoint or not keep, 'keep needs checkpoints'
+
+        self._state = state
+        self._entries = array('q')
+        self._cursor = 0
+        self._base = 0
+        self._checkpoint = checkpoint
+        self._keep = keep
+        self._checkpoints = [(0, state.copy())] if checkpoint else []
+        self._shared = False
+
+    def __len__(self):
+        """Count of stored moves."""
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        """Return memory size of stored moves in bytes."""
+        return len(self._entries) * self._entries.itemsize
+
+    @property
+    def move(self):
+        """Return number of moves applied to the state."""
+        return self._base + self._cursor
+
+    @property
+    def can_undo(self):
+        """Check if there is move to undo."""
+        return self._cursor > 0
+
+    @property
+    def can_redo(self):
+        """Check if there is undone move to redo."""
+        return self._cursor < len(self._entries)
+
+    @property
+    def checkpoints(self):
+        """Return list of (move number, GameState copy)."""
+        return self._checkpoints
+
+    def fork(self, state):
+        """Return journal of state copy with the same moves and cursor.
+        Moves are shared, the journal which changes them first copies
+        them, so fork does not depend on length of history.
+        :param state: copy of the state of this journal"""
+        res = Journal.__new__(Journal)
+        res._state = state
+        res._entries = self._entries
+        res._cursor = self._cursor
+        res._base = self._base
+        res._checkpoint = self._checkpoint
+        res._keep = self._keep
+        res._checkpoints = self._checkpoints
+        res._shared = self._shared = True
+        return res
+
+    def _own(self):
+        """Copy moves and checkpoints shared with forks."""
+        if self._shared:
+            self._entries = array('q', self._entries)
+            self._checkpoints = list(self._checkpoints)
+            self._shared = False
+
+    def _record(self, entry):
+        """Add applied move, forget undone moves."""
+        self._own()
+        del self._entries[self._cursor:]
+        del self._checkpoints[self._first_checkpoint_after(self.move):]
+        self._entries.append(entry)
+        self._cursor += 1
+        if self._checkpoint and self.move % self._checkpoint == 0:
+            self._checkpoints.append((self.move, self._state.copy()))
+            if self._keep and len(self._checkpoints) > self._keep:
+                self._drop_before(self._checkpoints[1][0])
+
+    def _first_checkpoint_after(self, move):
+        """Return index of the first checkpoint after move number."""
+        index = len(self._checkpoints)
+        while index and self._checkpoints[index - 1][0] > move:
+            index -= 1
+        return index
+
+    def _drop_before(self, move):
+        """Forget moves and checkpoints before move number."""
+        count = move - self._base
+        self._own()
+        del self._entries[:count]
+        self._cursor -= count
+        self._base = move
+        del self._checkpoints[:self._first_checkpoint_after(move) - 1]
+
+    def remove(self, *card_ids):
+        """Remove cards from the state as one move."""
+        assert 0 < len(card_ids) <= 2, 'one or two cards'
+        entry = 0
+        for card_id in card_ids:
+            zone, pos = self._state.remove(card_id)
+            entry = entry << _CARD_BITS | _pack_card(card_id, zone, pos)
+        self._record((entry << 1 | len(card_ids) - 1) << 1 | REMOVE)
+
+    def draw(self):
+        """Draw card from stock as one move.
+        :return: card id or EMPTY"""
+        recycled = not self._state.stock_size
+        card_id = self._state.draw()
+        if card_id != EMPTY:
+            self._record(int(recycled) << 1 | DRAW)
+        return card_id
+
+    def _apply(self, entry, forward):
+        """Apply move entry to the state or undo it.
+        :return: list of card ids of REMOVE move"""
+        if entry & 1 == DRAW:
+            if forward:
+                self._state.draw()
+            else:
+                self._state.undo_draw(bool(entry >> 1 & 1))
+            return []
+        entry >>= 1
+        count = (entry & 1) + 1
+        entry >>= 1
+        cards = [_unpack_card(entry >> _CARD_BITS * i & _CARD_MASK)
+                 for i in range(count - 1, -1, -1)]
+        if forward:
+            for card_id, zone, pos in cards:
+                self._state.remove(card_id)
+        else:
+            for card_id, zone, pos in reversed(cards):
+                self._state.restore(card_id, zone, pos)
+        return [card_id for card_id, zone, pos in cards]
+
+    def undo(self):
+        """Undo last move.
+        :return: card ids returned to the table"""
+        if not self._cursor:
+            raise IndexError('nothing to undo')
+        self._cursor -= 1
+        return self._apply(self._entries[self._cursor], False)
+
+    def redo(self):
+        """Redo last undone move.
+        :return: card ids removed from the table"""
+        if self._cursor == len(self._entries):
+            raise IndexError('nothing to redo')
+        self._cursor += 1
+        return self._apply(self._entries[self._cursor - 1], True)
+
+    def state_at(self, move):
+        """Return new GameState of move number, built from the nearest
+        checkpoint or by undo and redo of the live state copy."""
+        assert self._base <= move <= self._base + len(self._entries), \
+            'move is not in journal'
+        index = self._first_checkpoint_after(move)
+        if index:
+            start, state = self._checkpoints[index - 1]
+            state = state.copy()
+        else:
+            start, state = self.move, self._state.copy()
+        journal = Journal(state)
+        journal._entries = self._entries
+        journal._base = self._base
+        journal._cursor = start - self._base
+        while journal.move > move:
+            journal.undo()
+        while journal.move < move:
+            journal.redo()
+        return state
+
+
+def test():
+    # ---------------- Test ----------------
+    s = GameState(range(28), range(28, 52))
+    j = Journal(s, checkpoint=2, keep=2)
+    h = s.hash
+    j.draw()
+    j.remove(51)
+    j.remove(21, 22)
+    j.undo()
+    j.undo()
+    j.redo()
+    print(len(j), j.move, j.state_at(0).hash == h)
+    for i in range(30):
+        j.draw()
+    print(len(j), j.move, len(j.checkpoints))
+    f = j.fork(s.copy())
+    f.undo()
+    f.draw()
+    print(j.move, f.move, len(j), len(f))
+
+
+if __name__ == '__main__':
+    test()
@@ -1,67 +1,143 @@
 from deck import DeckGenerator  # only for test
 from deck import Card
-from functools import reduce
-import copy
+from state import GameState, EMPTY, PYRAMID, WASTE, TARGET, slot, row_col
+from journal import Journal
+from metrics import registry
+from rules import RuleSet, rule_set
+from time import perf_counter
+
 
 class TableCard:
     """Contain pyramid deck and additional deck."""
 
-    def __init__(self, deck):
+    def __init__(self, deck, rows=7):
         """
         Initializing class.
         :param deck: DeckGenerator object
+        :param rows: count of pyramid rows
+        _state - GameState object, created by generate_pyramid
         """
         assert isinstance(deck, DeckGenerator), 'deck object incorrect'
+        assert isinstance(rows, int) and 0 < rows and \
+            rows * (rows + 1) // 2 < len(deck), 'deck is too small for pyramid'
 
         self._current_deck = deck
-        self._pyramid = []
-        self._pyramid_rows = 7
+        self._state = None
+        self._pyramid_rows = rows
 
     def generate_pyramid(self):
-        """Generate pyramid."""
-        self._pyramid = [[self._current_deck.deck.pop() for j in range(i)]
-                         for i in range(1, self._pyramid_rows+1)]
+        """Generate pyramid. Rest of deck array becomes the stock."""
+        metrics = registry()
+        if metrics is not None:
+            start = perf_counter()
+        deck_ = self._current_deck.deck
+        pyramid = [deck_.pop() for i in range(1, self._pyramid_rows + 1)
+                   for j in range(i)]
+        self._state = GameState(pyramid, deck_, rows=self._pyramid_rows)
+        if metrics is not None:
+            metrics.since('deal', start)
+
+    @classmethod
+    def from_deal(cls, deal, rows=7, waste=()):
+        """Return table with generated pyramid from card ids of deal, top card
+        is last like in DeckGenerator; no DeckGenerator is created.
+        :param deal: sequence of card ids, e.g. record of deal corpus
+        :param waste: card ids of stack, top card is last"""
+        size = rows * (rows + 1) // 2
+        assert len(deal) > size, 'deal is too small for pyramid'
+        return cls.from_state(GameState(deal[::-1][:size], deal[:-size],
+                                        waste, rows=rows))
+
+    @classmethod
+    def from_state(cls, state):
+        """Return table of position, e.g. a saved one with empty stock and
+        waste; no DeckGenerator is created.
+        :param state: GameState object, it becomes state of the table"""
+        table = cls.__new__(cls)
+        table._current_deck = None
+        table._pyramid_rows = state.rows
+        table._state = state
+        return table
+
+    @classmethod
+    def from_deal_id(cls, deal_id, deck_count=1, rows=7):
+        """Return table with generated pyramid of numbered deal, see
+        deck.unrank_deal."""
+        table = cls(DeckGenerator(deck_count, deal_id), rows)
+        table.generate_pyramid()
+        return table
+
+    def fork(self):
+        """Return table of the same deck with independent copy of state."""
+        table = TableCard.__new__(TableCard)
+        table._current_deck = self._current_deck
+        table._pyramid_rows = self._pyramid_rows
+        table._state = self._state.copy()
+        return table
+
+    @property
+    def state(self):
+        """Return GameState object."""
+        return self._state
 
     @property
     def additional_deck(self):
         """Return additional deck object."""
         return self._current_deck
 
+    @property
+    def pyramid_rows(self):
+        """Return count of pyramid rows."""
+        return self._pyramid_rows
+
+    def card(self, row, col):
+        """Return Card object of pyramid or None if card was removed."""
+        card_id = self._state.pyramid[slot(row, col)]
+        return None if card_id == EMPTY else Card.from_id(card_id)
+
+    def is_open(self, row, col):
+        """Check if pyramid card is not covered."""
+        return self._state.is_open(slot(row, col))
+
+    def open_cards(self):
+        """Return list of uncovered pyramid cards, row by row."""
+        pyramid = self._state.pyramid
+        return [Card.from_id(pyramid[slot_])
+                for slot_ in self._state.open_slots()]
+
     @property
     def pyramid_deck(self):
-        """Return pyramid list."""
-        return self._pyramid
+        """Return pyramid list, None instead of removed cards."""
+        return [[self.card(row, col) for col in range(row + 1)]
+                for row in range(self._pyramid_rows)]
 
     def isPyramidCard(self, card_obj):
         """Check if is a Card object.
         :return: bool """
         assert isinstance(card_obj, Card), 'incorrect Card object'
 
-        if card_obj in self._current_deck.deck:
-            return False
-        for row in self._pyramid:
-            if card_obj in row:
-                return True
+        location = self._state.locate(card_obj.id)
+        return location is not None and location[0] == PYRAMID
 
     def __getitem__(self, item):
         """Return item from deck.
         :param item: Card object"""
         assert isinstance(item, Card), 'incorrect Card object'
-        if item in self._current_deck.deck:
+        if self._state.locate(item.id) is not None:
             return item
-        for row in self._pyramid:
-            if item in row:
-                return item
         return None
 
     def __str__(self):
         """Return pyramid in readable style."""
         res = ''
-        for row in self._pyramid:
-            for card in row:
+        for row, cards in enumerate(self.pyramid_deck):
+            for col, card in enumerate(cards):
+                if card is None:
+                    res += '|---| '
+                    continue
                 res += '|{}-{}-{}|'.format(card.rank, card.suit,
-                                           'Open' if card.status else 'Close') \
-                       + ' '
+                                           'Open' if self.is_open(row, col)
+                                           else 'Close') + ' '
             res += '\n'
         return res
 
@@ -69,126 +145,305 @@ class TableCard:
 class GameLogic:
     """Main game logic class."""
 
-    def __init__(self, table_obj):
+    def __init__(self, table_obj, checkpoint=0, keep=0, target=TARGET,
+                 aces_high=False, max_passes=None, rules=None):
         """
         Initializing class.
-        :param table_obj: TableCard object
+        :param table_obj: TableCard object with generated pyramid
+        :param checkpoint: journal checkpoint period in moves, 0 - never
+        :param keep: count of kept journal checkpoints, 0 - all history
+        :param target: sum of values of removed cards
+        :param aces_high: ace value is 14 instead of 1
+        :param max_passes: passes through the stock, None - state limit
+        :param rules: RuleSet of the game, level, target and ace value are
+                      taken from it; None - rule_set('easy', target,
+                      aces_high)
         """
         assert isinstance(table_obj, TableCard), 'incorrect table object'
+        assert table_obj.state is not None, 'pyramid is not generated'
+        assert rules is None or isinstance(rules, RuleSet), \
+            'incorrect RuleSet object'
 
         self._table_obj = table_obj
-        self._level = 'easy'
-        self._card_stack = []  # additional card stack
-        self._changes = {'pyramid_deck': [], 'add_deck': [],  # changes journal
-                         'stack': []}
-        self._history = []  # history of changes
+        self._state = table_obj.state
+        self._rules = rule_set('easy', target, aces_high) if rules is None \
+            else rules
+        if max_passes is not None:
+            self._state.max_passes = max_passes
+        self._journal = Journal(self._state, checkpoint, keep)  # changes
+        self._recorder = None  # replay log writer
+        self._metrics = registry()  # Metrics object or None
 
     def cardIndex(self, card_obj):
         """Return Card object index from different lists."""
         assert isinstance(card_obj, Card), 'incorrect Card object'
 
-        # if card in add deck
-        if card_obj in self._table_obj.additional_deck.deck:
-            return self._table_obj.additional_deck.deck.index(card_obj)
-        # if card in stack
-        elif card_obj in self._card_stack:
-            return self._card_stack.index(card_obj)
+        location = self._state.locate(card_obj.id)
+        if location is None:
+            return None
+        zone, pos = location
         # if card in pyramid deck
-        for row in self._table_obj.pyramid_deck:
-            if card_obj in row:
-                return self._table_obj.pyramid_deck.index(row), \
-                       row.index(card_obj)
-
-    def _del_card(self, card_obj):
-        """Mark card as None."""
-        assert isinstance(card_obj, Card), 'incorrect Card object'
-
-        # add copy Card object
-        if self._table_obj.isPyramidCard(card_obj):
-            self._changes['pyramid_deck'].append(copy.deepcopy(card_obj))
-            self._history.append({'pyramid_deck': self.cardIndex(card_obj)})
-        else:
-            if card_obj in self._card_stack:
-                self._changes['stack'].append(copy.deepcopy(card_obj))
-                self._history.append({'stack': self.cardIndex(card_obj)})
-            else:
-                self._changes['add_deck'].append(copy.deepcopy(card_obj))
-                self._history.append({'add_deck': self.cardIndex(card_obj)})
-
-        card_obj.rank = None
-        card_obj.suit = None
-        card_obj.status = False
+        if zone == PYRAMID:
+            return row_col(pos)
+        # if card in add deck or in stack
+        return pos
+
+    def is_open(self, card_obj):
+        """Check if card can be compared: uncovered pyramid card or top card
+        of stack."""
+        location = self._state.locate(card_obj.id)
+        if location is None:
+            return False
+        zone, pos = location
+        if zone == PYRAMID:
+            return self._state.is_open(pos)
+        return zone == WASTE and pos == self._state.waste_size - 1
+
+    def _del_card(self, *cards):
+        """Remove cards from table as one journal move."""
+        assert all(isinstance(card, Card) for card in cards), \
+            'incorrect Card object'
+
+        card_ids = [card.id for card in cards]
+        self._journal.remove(*card_ids)
+        if self._recorder is not None:
+            self._recorder.remove(*card_ids)
+
+    def undo(self):
+        """Undo last move.
+        :returns: list of Card objects returned to the table"""
+        metrics = self._metrics
+        if metrics is not None:
+            start = perf_counter()
+        cards = [Card.from_id(card_id) for card_id in self._journal.undo()]
+        if self._recorder is not None:
+            self._recorder.undo()
+        if metrics is not None:
+            metrics.since('undo', start)
+        return cards
+
+    def redo(self):
+        """Redo last undone move.
+        :returns: list of Card objects removed from the table"""
+        metrics = self._metrics
+        if metrics is not None:
+            start = perf_counter()
+        cards = [Card.from_id(card_id) for card_id in self._journal.redo()]
+        if self._recorder is not None:
+            self._recorder.redo()
+        if metrics is not None:
+            metrics.since('redo', start)
+        return cards
 
     def redo_changes(self):
-        """Return redo information.
-        :returns: card, card_index, card_type """
-        last_del_elem = self._history.pop()  # dict
-        card_type = list(last_del_elem.keys())[0]  # add_deck or pyramid_deck
-                                                   # or stack (str)
-        card = self._changes[card_type].pop()  # card obj
-        card_index = last_del_elem[card_type]  # index of returned card
-        return {'card': card, 'card_index': card_index, 'card_type': card_type}
+        """Undo last move, old name of undo.
+        :returns: list of Card objects returned to the table"""
+        return self.undo()
 
     def compare_card(self, *args):
         """Compare and delete cards from deck."""
-        assert all(list(map(lambda obj: isinstance(obj, Card), list(args)))), \
+        metrics = self._metrics
+        if metrics is None:
+            return self._compare_card(*args)
+        start = perf_counter()
+        try:
+            self._compare_card(*args)
+        except (ValueError, AssertionError) as e:
+            metrics.count('compare_failed:' + (str(e) or type(e).__name__))
+            raise
+        metrics.since('compare', start)
+        metrics.journal(self._journal)
+
+    def _compare_card(self, *args):
+        """Check rules of level and delete cards."""
+        assert all(isinstance(card, Card) for card in args), \
             'this is not Card object'
 
-        if any(list(map(lambda obj: obj in self._card_stack, list(args)))):
-            map(lambda obj: self._del_card(obj), list(args))
-        if all(list(map(lambda obj: obj.status, list(args)))):
-            if sum(list(map(lambda obj: obj.value, list(args)))) == 13:
-                # compare to suits (hard mode)
-                if self._level == 'hard':
-                    if len(args) != 1:
-                        assert reduce(
-                            lambda a, b: a.suit == b.suit if a else None,
-                            list(args)), 'different suits'
-
-                for item in args:
-                    self._del_card(item)
-            else:
-                raise ValueError('sum of values is not 13')
-        else:
+        if len(set(args)) != len(args):
+            raise ValueError('the same card twice')
+        if not all(self.is_open(card) for card in args):
             raise ValueError('one of the cards is closed')
+        card_ids = [card.id for card in args]
+        if not self._rules.legal(*card_ids):
+            raise ValueError(self._rules.error(*card_ids))
+        self._del_card(*args)
+
+    def legal_moves(self):
+        """Generate legal moves of current level, kings first.
+        :return: tuples of one or two Card objects"""
+        for move in self._state.moves(faces=self._rules.faces):
+            yield tuple(map(Card.from_id, move))
+
+    @property
+    def rules(self):
+        """Return RuleSet of level, target and ace value."""
+        return self._rules
 
     @property
     def table(self):
         """Return TableCard object."""
         return self._table_obj
 
+    @property
+    def state(self):
+        """Return compact GameState of the game."""
+        return self._state
+
+    @property
+    def journal(self):
+        """Return undo/redo Journal object."""
+        return self._journal
+
+    @property
+    def target(self):
+        """Return sum of values of removed cards."""
+        return self._rules.target
+
+    @property
+    def aces_high(self):
+        """Check if ace value is 14."""
+        return self._rules.aces_high
+
+    @property
+    def max_passes(self):
+        """Return limit of passes through the stock, None - unlimited."""
+        return self._state.max_passes
+
+    @max_passes.setter
+    def max_passes(self, max_passes):
+        self._state.max_passes = max_passes
+
     @property
     def card_from_additional_deck(self):
-        """Return card from additional deck."""
-        deck_ = self._table_obj.additional_deck.deck
-        if deck_:
-            current_card = deck_.pop()
-            if current_card.rank is not None:
-                current_card.status = True
-            self._card_stack.append(current_card)
-            if not deck_:
-                deck_.extend(self._card_stack)
-                self._card_stack.clear()
-            return current_card
-        for card in self._card_stack:
-            card.status = False
+        """Move card from additional deck to stack and return it."""
+        metrics = self._metrics
+        if metrics is not None:
+            start = perf_counter()
+            recycled = not self._state.stock_size
+        card_id = self._journal.draw()
+        if metrics is not None and card_id != EMPTY:
+            metrics.since('draw', start)
+            if recycled:
+                metrics.count('recycle')
+            metrics.journal(self._journal)
+        if card_id != EMPTY:
+            if self._recorder is not None:
+                self._recorder.draw()
+            return Card.from_id(card_id)
+
+    @property
+    def current_card(self):
+        """Return top card of stack or None."""
+        top = self._state.waste_top
+        if top != EMPTY:
+            return Card.from_id(top)
+
+    @property
+    def recorder(self):
+        """Return replay log writer or None."""
+        return self._recorder
+
+    @recorder.setter
+    def recorder(self, recorder):
+        """Set replay log writer, None - do not record moves."""
+        self._recorder = recorder
+
+    @property
+    def metrics(self):
+        """Return Metrics object or None if instrumentation is off."""
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        """Set Metrics object, None - turn instrumentation off."""
+        self._metrics = metrics
 
     @property
     def card_stack(self):
         """Return cards stack."""
-        return self._card_stack
+        return [Card.from_id(card_id) for card_id in self._state.waste]
 
     @property
     def level(self):
         """Return game level."""
-        return self._level
+        return self._rules.level
 
     @level.setter
     def level(self, level):
         """Set game level value."""
         levels = ['easy', 'hard']
         assert level in levels, 'incorrect level'
-        self._level = level
+        self._rules = self._rules.of_level(level)
+
+    def snapshot(self):
+        """Return Snapshot of current position, level and undo history."""
+        return Snapshot(self)
+
+    def fork(self):
+        """Return independent game of current position, level and undo
+        history. Undo history is shared until one of games changes it.
+        Fork has no recorder and no metrics."""
+        return self._branch(self._table_obj, self._journal, self._rules)
+
+    @classmethod
+    def _branch(cls, table_obj, journal, rules):
+        """Return game of copy of table and fork of journal."""
+        res = cls.__new__(cls)
+        res._table_obj = table_obj.fork()
+        res._state = res._table_obj.state
+        res._rules = rules
+        res._journal = journal.fork(res._state)
+        res._recorder = None
+        res._metrics = None
+        return res
+
+
+class Snapshot:
+    """Saved position of GameLogic: state, level and undo history.
+
+    Snapshot is never changed, fork starts new game from it, so one
+    position can be branched many times. Position is copied once, undo
+    history is shared with the game and forks.
+    """
+
+    __slots__ = ('_table_obj', '_journal', '_rules')
+
+    def __init__(self, game_logic):
+        """
+        Initializing class.
+        :param game_logic: GameLogic object
+        """
+        assert isinstance(game_logic, GameLogic), 'incorrect GameLogic object'
+
+        self._table_obj = game_logic.table.fork()
+        self._journal = game_logic.journal.fork(self._table_obj.state)
+        self._rules = game_logic.rules
+
+    @property
+    def state(self):
+        """Return saved GameState object, it must not be changed."""
+        return self._table_obj.state
+
+    @property
+    def level(self):
+        """Return game level."""
+        return self._rules.level
+
+    @property
+    def rules(self):
+        """Return RuleSet of the game."""
+        return self._rules
+
+    @property
+    def move(self):
+        """Return number of moves applied before snapshot."""
+        return self._journal.move
+
+    def fork(self):
+        """Return new GameLogic object of saved position."""
+        return GameLogic._branch(self._table_obj, self._journal,
+                                 self._rules)
+
 
 def test():
     # ---------------- Test ----------------
@@ -196,15 +451,19 @@ def test():
     d.shuffle()
     t = TableCard(d)
     t.generate_pyramid()
-    for i in t.pyramid_deck:
-        for j in i:
-            j.status = True
     print(t)
-    for i in t.additional_deck.deck:
-        i.status = True
-        print(t.additional_deck.deck.index(i), i)
+    for i in t.additional_deck:
+        print(t.additional_deck.deck.index(i.id), i)
     gl = GameLogic(t)
-
+    print(gl.state)
+    gl.card_from_additional_deck
+    snapshot = gl.snapshot()
+    fork = snapshot.fork()
+    fork.card_from_additional_deck
+    fork.undo()
+    print(fork.state == snapshot.state, gl.journal.move, fork.journal.move)
+    fork.undo()
+    print(gl.state == snapshot.state, gl.journal.can_undo)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,163 @@
+from bisect import bisect_left
+from time import perf_counter
+import json
+
+# upper bounds of latency histogram buckets, seconds
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+           1e-3, 1e-2, 1e-1, 1.0)
+
+_registry = None  # Metrics of new games, None - instrumentation is off
+
+
+class Histogram:
+    """Latency histogram with fixed buckets."""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        """
+        Initializing class.
+        counts - observations of every bucket, the last one is +Inf
+        """
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        """Add one observation."""
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def to_dict(self):
+        """Return plain dict: count, sum and cumulative buckets."""
+        buckets = {}
+        total = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), self.counts):
+            total += count
+            buckets[str(bound)] = total
+        return {'count': self.count, 'sum': self.sum, 'buckets': buckets}
+
+
+class Metrics:
+    """Counters, gauges and latency histograms of game operations.
+
+    Names are plain strings, a label is added as 'name:label', e.g.
+    'compare_failed:sum of values is not 13', Prometheus export shows it
+    as reason label. GameLogic checks its metrics for None before timing,
+    so games created while instrumentation is off pay one comparison.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def count(self, name, value=1):
+        """Increase counter."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        """Set gauge to value."""
+        self.gauges[name] = value
+
+    def observe(self, name, seconds):
+        """Count operation and add its latency to histogram."""
+        self.counters[name] = self.counters.get(name, 0) + 1
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+
+    def since(self, name, start):
+        """Observe latency of operation started at perf_counter() start."""
+        self.observe(name, perf_counter() - start)
+
+    def journal(self, journal):
+        """Set gauges of undo history size."""
+        self.gauges['journal_moves'] = len(journal)
+        self.gauges['journal_bytes'] = journal.nbytes
+        self.gauges['journal_checkpoints'] = len(journal.checkpoints)
+
+    def reset(self):
+        """Forget all values."""
+        self.counters.clear()
+        self.gauges.clear()
+        self.histograms.clear()
+
+    def snapshot(self):
+        """Return plain dict of all values."""
+        return {'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {name: histogram.to_dict() for name, histogram
+                               in self.histograms.items()}}
+
+    def to_json(self):
+        """Return snapshot as JSON text."""
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self, prefix='pyramid_'):
+        """Return values in Prometheus text format."""
+        lines = []
+
+        def metric(name):
+            name, _, label = name.partition(':')
+            label = label.replace('\\', '\\\\').replace('"', '\\"')
+            return prefix + name, '{{reason="{}"}}'.format(label) \
+                if label else ''
+
+        for name, value in sorted(self.counters.items()):
+            name, label = metric(name)
+            lines.append('{}_total{} {}'.format(name, label, value))
+        for name, value in sorted(self.gauges.items()):
+            name, label = metric(name)
+            lines.append('{}{} {}'.format(name, label, value))
+        for name, histogram in sorted(self.histograms.items()):
+            name, _ = metric(name)
+            name += '_seconds'
+            for bound, count in histogram.to_dict()['buckets'].items():
+                lines.append('{}_bucket{{le="{}"}} {}'.format(name, bound,
+                                                              count))
+            lines.append('{}_sum {}'.format(name, histogram.sum))
+            lines.append('{}_count {}'.format(name, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+
+def enable(metrics=None):
+    """Turn instrumentation on for games created from now on.
+    :param metrics: Metrics object, None - new one
+    :return: Metrics object"""
+    global _registry
+    _registry = metrics or Metrics()
+    return _registry
+
+
+def disable():
+    """Turn instrumentation off for games created from now on."""
+    global _registry
+    _registry = None
+
+
+def registry():
+    """Return Metrics object of new games or None if it is off."""
+    return _registry
+
+
+def test():
+    # ---------------- Test ----------------
+    from engine import Engine
+    # the module imported by logic, not __main__
+    from metrics import enable, disable
+    metrics = enable()
+    engine = Engine(seed=1)
+    for _ in range(100):
+        hint = engine.hint()
+        engine.step('n') if hint is None else engine.step('c', *hint.split())
+    engine.step('c', 'x', 'x')
+    engine.step('r')
+    disable()
+    print(metrics.to_prometheus())
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,243 @@
+from deck import Card, DeckGenerator
+from logic import TableCard, GameLogic
+from state import GameState
+from time import perf_counter
+import argparse
+import struct
+
+# record tags
+DRAW = 0x01
+UNDO = 0x02
+REDO = 0x03
+REMOVE1 = 0x04  # + card id
+REMOVE2 = 0x05  # + two card ids
+GAME_SEED = 0xF0  # new game dealt by DeckGenerator.shuffle(seed)
+GAME_STATE = 0xF1  # new game from saved pyramid, stock and waste
+
+LEVELS = ('easy', 'hard')
+# level byte: level index, ACES_HIGH flag; target byte: sum of values;
+# passes byte: pass limit, 0 - unlimited; in GAME_STATE passes left from
+# the saved position
+ACES_HIGH = 0x80
+SEED_HEADER = struct.Struct('<BQBBBBB')  # tag, seed, decks, rows, level,
+                                         # target, passes
+STATE_HEADER = struct.Struct('<BBBBBBHHH')  # tag, decks, rows, level,
+                                            # target, passes, pyramid,
+                                            # stock, waste lengths
+CARD = struct.Struct('<H')
+PAIR = struct.Struct('<HH')
+
+
+class ReplayWriter:
+    """Append-only binary log of games, buffered in memory.
+
+    Game starts with GAME_SEED or GAME_STATE record, every move is one
+    tag byte and the card ids of removed cards (2 bytes each).
+    """
+
+    def __init__(self, path, buffer_size=65536):
+        """
+        Initializing class.
+        :param path: log file path, opened for append
+        :param buffer_size: bytes kept in memory before write
+        """
+        self._file = open(path, 'ab')
+        self._buffer = bytearray()
+        self._buffer_size = buffer_size
+
+    def _add(self, data):
+        """Add bytes to buffer, write full buffer."""
+        self._buffer += data
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def attach(self, game_logic, seed=None, deck_count=1):
+        """Start game record and record all moves of game_logic.
+        :param seed: deal seed of DeckGenerator.shuffle, None - save the
+                     current position instead
+        :raise ValueError: if seed, deck count, rows, target or pass limit
+                           do not fit the header"""
+        state = game_logic.state
+        level = LEVELS.index(game_logic.level)
+        if game_logic.aces_high:
+            level |= ACES_HIGH
+        passes = game_logic.max_passes or 0
+        if passes and seed is None:
+            passes -= state.passes - 1
+        if seed is not None and not 0 <= seed < 1 << 64:
+            raise ValueError('seed must be 0...2 ** 64 - 1')
+        for name, value in (('deck count', deck_count), ('rows', state.rows),
+                            ('target', game_logic.target),
+                            ('pass limit', passes)):
+            if not 0 <= value <= 255:
+                raise ValueError('{} must be 0...255'.format(name))
+        if seed is not None:
+            self._add(SEED_HEADER.pack(GAME_SEED, seed, deck_count,
+                                       state.rows, level, game_logic.target,
+                                       passes))
+        else:
+            self._add(STATE_HEADER.pack(
+                GAME_STATE, deck_count, state.rows, level, game_logic.target,
+                passes, len(state.pyramid), len(state.stock),
+                len(state.waste)))
+            for cards in (state.pyramid, state.stock, state.waste):
+                self._add(struct.pack('<{}h'.format(len(cards)), *cards))
+        game_logic.recorder = self
+
+    def draw(self):
+        """Record draw from stock."""
+        self._add(b'\x01')
+
+    def undo(self):
+        """Record undo."""
+        self._add(b'\x02')
+
+    def redo(self):
+        """Record redo."""
+        self._add(b'\x03')
+
+    def remove(self, *card_ids):
+        """Record removed cards."""
+        if len(card_ids) == 1:
+            self._add(bytes((REMOVE1,)) + CARD.pack(*card_ids))
+        else:
+            self._add(bytes((REMOVE2,)) + PAIR.pack(*card_ids))
+
+    def flush(self):
+        """Write buffer to file."""
+        self._file.write(self._buffer)
+        self._buffer.clear()
+        self._file.flush()
+
+    def close(self):
+        """Flush and close file."""
+        self.flush()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _new_game(data, offset):
+    """Return (GameLogic, offset after header) of game header record."""
+    if data[offset] == GAME_SEED:
+        tag, seed, deck_count, rows, level, target, passes = \
+            SEED_HEADER.unpack_from(data, offset)
+        deck = DeckGenerator(deck_count)
+        deck.shuffle(seed)
+        table = TableCard.from_deal(deck.deck, rows)
+        offset += SEED_HEADER.size
+    else:
+        tag, deck_count, rows, level, target, passes, pyramid, stock, \
+            waste = STATE_HEADER.unpack_from(data, offset)
+        offset += STATE_HEADER.size
+        ids = struct.unpack_from('<{}h'.format(pyramid + stock + waste),
+                                 data, offset)
+        offset += 2 * len(ids)
+        table = TableCard.from_state(GameState(
+            ids[:pyramid], ids[pyramid:pyramid + stock],
+            ids[pyramid + stock:], rows))
+    game_logic = GameLogic(table, target=target,
+                           aces_high=bool(level & ACES_HIGH),
+                           max_passes=passes or None)
+    game_logic.level = LEVELS[level & ~ACES_HIGH]
+    return game_logic, offset
+
+
+def replay(data, validate=True):
+    """Replay all games of log data.
+    :param validate: check rules of every removal with compare_card,
+                     False - apply moves to the journal directly
+    :return: generator of (GameLogic after last move, count of moves)"""
+    data = memoryview(data)
+    offset = 0
+    game_logic = None
+    moves = 0
+    while offset < len(data):
+        tag = data[offset]
+        if tag >= GAME_SEED:
+            if game_logic is not None:
+                yield game_logic, moves
+            game_logic, offset = _new_game(data, offset)
+            journal = game_logic.journal
+            moves = 0
+            continue
+        offset += 1
+        moves += 1
+        if tag == DRAW:
+            journal.draw()
+        elif tag == UNDO:
+            journal.undo()
+        elif tag == REDO:
+            journal.redo()
+        else:
+            if tag == REMOVE1:
+                card_ids = CARD.unpack_from(data, offset)
+            else:
+                card_ids = PAIR.unpack_from(data, offset)
+            offset += 2 * len(card_ids)
+            if validate:
+                game_logic.compare_card(*map(Card.from_id, card_ids))
+            else:
+                journal.remove(*card_ids)
+    if game_logic is not None:
+        yield game_logic, moves
+
+
+def replay_file(path, validate=True):
+    """Replay all games of log file, see replay."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    return replay(data, validate)
+
+
+def test():
+    # ---------------- Test ----------------
+    import os
+    import tempfile
+    from solver import solve
+    path = os.path.join(tempfile.mkdtemp(), 'test.log')
+    deck = DeckGenerator()
+    deck.shuffle(3)
+    game_logic = GameLogic(TableCard.from_deal(deck.deck))
+    moves = solve(game_logic)[1]
+    # save position of the first pass end: stock is empty, pyramid is
+    # partly removed
+    state, journal = game_logic.state, game_logic.journal
+    while state.stock:
+        move = moves.pop(0)
+        journal.draw() if move is None else journal.remove(*move)
+    with ReplayWriter(path) as writer:
+        writer.attach(game_logic)
+        for move in moves:
+            if move is None:
+                game_logic.card_from_additional_deck
+            else:
+                game_logic.compare_card(*map(Card.from_id, move))
+    for replayed, count in replay_file(path):
+        print(replayed.state == game_logic.state, replayed.state.won, count)
+
+def main(argv=None):
+    """Command line: replay log and print games and speed."""
+    parser = argparse.ArgumentParser(description='Replay game log')
+    parser.add_argument('path')
+    parser.add_argument('--no-validate', action='store_true')
+    args = parser.parse_args(argv)
+
+    games = wins = moves = 0
+    start = perf_counter()
+    for game_logic, game_moves in replay_file(args.path,
+                                              not args.no_validate):
+        games += 1
+        wins += game_logic.state.won
+        moves += game_moves
+    seconds = perf_counter() - start
+    print('games={} wins={} moves={} moves/s={:.0f}'.format(
+        games, wins, moves, moves / seconds if seconds else 0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+from state import FACES, RANKS, TARGET, move_faces, rank_values
+from functools import lru_cache
+
+
+class RuleSet:
+    """Rules of removing cards compiled to tables of faces.
+
+    Copies of one face in multi-deck games follow the same rules, so a
+    card id is checked by its face: removable alone is one byte lookup,
+    removable together is one bit of the face's partners bitmask. The
+    tables are built from faces, (faces removed alone, pairs of faces
+    removed together) like state.move_faces; a variant of the game
+    overrides _faces and error and is passed as rules to GameLogic,
+    solver, advisor, dead card detector and batch environment, which all
+    use the same tables.
+    """
+
+    def __init__(self, target=TARGET, aces_high=False, suited=False):
+        """
+        Initializing class.
+        :param target: sum of values of removed cards
+        :param aces_high: ace value is 14 instead of 1
+        :param suited: pairs must have the same suit (hard mode)
+        faces - (faces removed alone, pairs of faces), pair faces are
+        ordered, equal faces mean two copies of it; partners - tuple of
+        faces removed together with every face
+        """
+        self._target = target
+        self._aces_high = aces_high
+        self._suited = suited
+        self._values = rank_values(aces_high)
+        self.faces = self._faces()
+        singles, pairs = self.faces
+        self._singles = bytearray(FACES)
+        for face in singles:
+            self._singles[face] = 1
+        self._pairs = [0] * FACES  # bitmask of partner faces of every face
+        for face, other in pairs:
+            self._pairs[face] |= 1 << other
+            self._pairs[other] |= 1 << face
+        self.partners = tuple(tuple(other for other in range(FACES)
+                                    if mask >> other & 1)
+                              for mask in self._pairs)
+
+    def _faces(self):
+        """Return (faces removed alone, pairs of faces) of rules."""
+        return move_faces(self._target, self._aces_high, self._suited)
+
+    def of_level(self, level):
+        """Return rules of level: 'easy' or 'hard' (pairs of the same
+        suit) with the same target, ace value and variant."""
+        assert level in ('easy', 'hard'), 'incorrect level'
+        suited = level == 'hard'
+        if suited == self._suited:
+            return self
+        if type(self) is RuleSet:
+            return rule_set(level, self._target, self._aces_high)
+        return type(self)(self._target, self._aces_high, suited)
+
+    @property
+    def level(self):
+        """Return 'hard' if pairs must have the same suit, else
+        'easy'."""
+        return 'hard' if self._suited else 'easy'
+
+    @property
+    def target(self):
+        """Return sum of values of removed cards."""
+        return self._target
+
+    @property
+    def aces_high(self):
+        """Check if ace value is 14."""
+        return self._aces_high
+
+    @property
+    def suited(self):
+        """Check if pairs must have the same suit."""
+        return self._suited
+
+    def removable(self, card_id):
+        """Check if card is removed alone."""
+        return bool(self._singles[card_id % FACES])
+
+    def compatible(self, card_id, other_id):
+        """Check if two cards are removed together."""
+        return bool(self._pairs[card_id % FACES] >> other_id % FACES & 1)
+
+    def legal(self, *card_ids):
+        """Check if one or two cards are removed together."""
+        if len(card_ids) == 1:
+            return bool(self._singles[card_ids[0] % FACES])
+        if len(card_ids) == 2:
+            return bool(self._pairs[card_ids[0] % FACES] >>
+                        card_ids[1] % FACES & 1)
+        return False
+
+    def error(self, *card_ids):
+        """Return message why cards are not removed together."""
+        if len(card_ids) not in (1, 2):
+            return 'enter one or two cards'
+        faces = [card_id % FACES for card_id in card_ids]
+        if sum(self._values[face % RANKS] for face in faces) != self._target:
+            return 'sum of values is not {}'.format(self._target)
+        if self._suited and len(set(face // RANKS for face in faces)) > 1:
+            return 'different suits'
+        return 'cards cannot be removed together'
+
+
+def rule_set(level='easy', target=TARGET, aces_high=False):
+    """Return shared RuleSet of level: 'easy' or 'hard' (pairs of the same
+    suit)."""
+    assert level in ('easy', 'hard'), 'incorrect level'
+    return _rule_set(target, bool(aces_high), level == 'hard')
+
+
+@lru_cache(maxsize=None)
+def _rule_set(target, aces_high, suited):
+    """Return RuleSet, one object for every set of arguments."""
+    return RuleSet(target, aces_high, suited)
+
+
+def test():
+    # ---------------- Test ----------------
+    from deck import Card
+    rules = rule_set('hard')
+    king, six, seven = Card('K', 'H'), Card('6', 'S'), Card('7', 'S')
+    print(rules.legal(king.id), rules.legal(six.id, seven.id),
+          rules.legal(six.id, Card('7', 'H').id))
+    print(rules.error(six.id, Card('7', 'H').id), '|',
+          rules.error(six.id, six.id + 1))
+
+
+if __name__ == '__main__':
+    test()
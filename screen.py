@@ -0,0 +1,86 @@
+import sys
+
+CLEAR = '\x1b[H\x1b[2J'  # cursor home, clear screen
+CLEAR_LINE = '\x1b[K'  # clear to the end of line
+CLEAR_BELOW = '\x1b[J'  # clear to the end of screen
+
+
+def move(row, col):
+    """Return ANSI sequence which moves cursor to 0-based row and col."""
+    return '\x1b[{};{}H'.format(row + 1, col + 1)
+
+
+class Screen:
+    """Terminal frame buffer, only changed cells are redrawn.
+
+    Frame is a list of text lines drawn from the top left corner. render
+    compares it with the previous frame and writes, for every changed
+    line, a cursor move and the changed span in one buffered write; the
+    cursor is left below the frame for input.
+    """
+
+    def __init__(self, stream=None):
+        """
+        Initializing class.
+        :param stream: text stream of terminal, None - sys.stdout
+        _lines - lines of the frame on the screen, None - screen is unknown
+        """
+        self._stream = stream or sys.stdout
+        self._lines = None
+
+    def invalidate(self):
+        """Forget the screen, next frame is drawn fully."""
+        self._lines = None
+
+    def clear(self):
+        """Clear screen, e.g. before text printed outside of frames."""
+        self._write(CLEAR)
+        self._lines = None
+
+    def _write(self, text):
+        self._stream.write(text)
+        self._stream.flush()
+
+    def render(self, lines):
+        """Draw frame of text lines."""
+        out = []
+        old = self._lines
+        if old is None:
+            out.append(CLEAR)
+            old = []
+        for row, line in enumerate(lines):
+            previous = old[row] if row < len(old) else ''
+            if line == previous:
+                continue
+            # changed span of the line
+            start = 0
+            size = min(len(line), len(previous))
+            while start < size and line[start] == previous[start]:
+                start += 1
+            end = len(line)
+            if len(line) == len(previous):
+                while end > start and line[end - 1] == previous[end - 1]:
+                    end -= 1
+            out.append(move(row, start))
+            out.append(line[start:end])
+            if len(line) < len(previous):
+                out.append(CLEAR_LINE)
+        # old frame lines below the new one, prompts and messages
+        out.append(move(len(lines), 0))
+        out.append(CLEAR_BELOW)
+        self._write(''.join(out))
+        self._lines = list(lines)
+
+
+def test():
+    # ---------------- Test ----------------
+    import io
+    stream = io.StringIO()
+    screen = Screen(stream)
+    screen.render(['  1:S 2:H', 'Extra card: 5:D'])
+    screen.render(['  1:S  - ', 'Extra card: 5:D'])
+    print(repr(stream.getvalue()))
+
+
+if __name__ == '__main__':
+    test()
@@ -0,0 +1,266 @@
+from engine import Engine, check_table
+from cache import PositionCache
+from state import TARGET
+from time import monotonic, perf_counter
+import argparse
+import asyncio
+import json
+import secrets
+
+
+class Session:
+    """One game of the server."""
+
+    __slots__ = ('engine', 'last_used')
+
+    def __init__(self, engine):
+        """
+        Initializing class.
+        :param engine: Engine object of the game
+        """
+        self.engine = engine
+        self.last_used = monotonic()
+
+
+class GameServer:
+    """Many pyramid games in one asyncio process, JSON-lines protocol.
+
+    Request: {"id": any, "session": str, "cmd": str, "args": [...]}, where
+    cmd is an Engine command, "new" (args: level, decks, seed, rows,
+    target, aces_high, max_passes, deal_id) or "close". Response:
+    {"id": any, "session": str, "obs": {...}} or
+    {"id": any, "error": str}. Every connection is served in order and
+    the next request is read only when the response is sent, so slow
+    clients are not buffered without limit.
+    """
+
+    def __init__(self, idle_timeout=600, max_sessions=10000,
+                 max_line=65536, cache=None, hint_budget=None):
+        """
+        Initializing class.
+        :param idle_timeout: seconds after which unused session is evicted
+        :param max_sessions: limit of open sessions
+        :param max_line: limit of request line length
+        :param cache: cache.PositionCache of hints shared by all sessions,
+                      None - no cache
+        :param hint_budget: seconds of search of a hint, None - the first
+                            legal move
+        """
+        self._sessions = {}
+        self._idle_timeout = idle_timeout
+        self._max_sessions = max_sessions
+        self._max_line = max_line
+        self._cache = cache
+        self._hint_budget = hint_budget
+
+    def __len__(self):
+        """Count of open sessions."""
+        return len(self._sessions)
+
+    def _new(self, level='easy', decks=1, seed=None, rows=7, target=TARGET,
+             aces_high=False, max_passes=None, deal_id=None):
+        """Create session, return its id and engine."""
+        check_table(decks, rows)
+        if len(self._sessions) >= self._max_sessions:
+            self.evict()
+            if len(self._sessions) >= self._max_sessions:
+                raise ValueError('server is full')
+        engine = Engine(level=level, deck_count=decks, seed=seed, rows=rows,
+                        target=target, aces_high=bool(aces_high),
+                        max_passes=max_passes, cache=self._cache,
+                        hint_budget=self._hint_budget, deal_id=deal_id)
+        session_id = secrets.token_hex(8)
+        self._sessions[session_id] = Session(engine)
+        return session_id, engine
+
+    def handle(self, request):
+        """Return response dict of request dict."""
+        response = {'id': request.get('id')}
+        try:
+            command = request['cmd']
+            args = request.get('args', [])
+            if not isinstance(args, list):
+                raise ValueError('args must be list')
+            if command == 'new':
+                session_id, engine = self._new(*args)
+                response['session'] = session_id
+                response['obs'] = engine.observation()
+                return response
+            session_id = request.get('session')
+            session = self._sessions.get(session_id)
+            if session is None:
+                raise ValueError('unknown session')
+            response['session'] = session_id
+            if command == 'close':
+                del self._sessions[session_id]
+                return response
+            session.last_used = monotonic()
+            observation = session.engine.step(command,
+                                              *map(str, args))
+            if observation['error'] is not None:
+                response['error'] = observation['error']
+            response['obs'] = observation
+        except (KeyError, ValueError, TypeError, AssertionError) as e:
+            response['error'] = str(e) or type(e).__name__
+        return response
+
+    def evict(self):
+        """Close sessions unused longer than idle timeout.
+        :return: count of closed sessions"""
+        deadline = monotonic() - self._idle_timeout
+        old = [session_id for session_id, session in self._sessions.items()
+               if session.last_used < deadline]
+        for session_id in old:
+            del self._sessions[session_id]
+        return len(old)
+
+    async def _evict_loop(self):
+        """Evict idle sessions periodically."""
+        while True:
+            await asyncio.sleep(max(self._idle_timeout / 10, 0.1))
+            self.evict()
+
+    async def _client(self, reader, writer):
+        """Serve requests of one connection."""
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # line is longer than limit
+                    response = {'id': None, 'error': 'request is too long'}
+                    writer.write(json.dumps(response).encode() + b'\n')
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError
+                except ValueError:
+                    response = {'id': None, 'error': 'incorrect JSON'}
+                else:
+                    response = self.handle(request)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()  # backpressure
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=7777, path=None):
+        """Serve TCP host:port, or Unix socket path if it is given."""
+        if path is not None:
+            server = await asyncio.start_unix_server(
+                self._client, path, limit=self._max_line)
+        else:
+            server = await asyncio.start_server(
+                self._client, host, port, limit=self._max_line)
+        evict_task = asyncio.ensure_future(self._evict_loop())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            evict_task.cancel()
+
+
+def percentile(values, share):
+    """Return value of sorted list at share (0-1)."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+async def _load_client(connect, steps, latencies):
+    """Play games by hints over one connection, collect latencies."""
+    reader, writer = await connect()
+
+    async def request(command, *args, session=None):
+        start = perf_counter()
+        writer.write(json.dumps({'cmd': command, 'args': list(args),
+                                 'session': session}).encode() + b'\n')
+        await writer.drain()
+        response = json.loads(await reader.readline())
+        latencies.setdefault(command, []).append(perf_counter() - start)
+        return response
+
+    session = (await request('new'))['session']
+    for step in range(steps):
+        hint = (await request('?', session=session))['obs'].get('hint')
+        if hint is None:
+            response = await request('n', session=session)
+        else:
+            response = await request('c', *hint.split(), session=session)
+        if response['obs']['won']:
+            await request('ng', session=session)
+    await request('close', session=session)
+    writer.close()
+
+
+async def load_test(clients=100, steps=100, host='127.0.0.1', port=7777,
+                    path=None):
+    """Run concurrent clients against server.
+    :return: dict command -> {count, p50, p99} in milliseconds"""
+    if path is not None:
+        def connect():
+            return asyncio.open_unix_connection(path)
+    else:
+        def connect():
+            return asyncio.open_connection(host, port)
+    latencies = {}
+    await asyncio.gather(*[_load_client(connect, steps, latencies)
+                           for _ in range(clients)])
+    res = {}
+    for command, values in sorted(latencies.items()):
+        values.sort()
+        res[command] = {'count': len(values),
+                        'p50': percentile(values, 0.5) * 1000,
+                        'p99': percentile(values, 0.99) * 1000}
+    return res
+
+
+def main(argv=None):
+    """Command line: serve or load subcommands."""
+    parser = argparse.ArgumentParser(description='Pyramid game server')
+    commands = parser.add_subparsers(dest='command', required=True)
+    for name in ('serve', 'load'):
+        command = commands.add_parser(name)
+        command.add_argument('--host', default='127.0.0.1')
+        command.add_argument('--port', type=int, default=7777)
+        command.add_argument('--unix', help='Unix socket path')
+    commands.choices['serve'].add_argument('--idle-timeout', type=float,
+                                           default=600)
+    commands.choices['serve'].add_argument('--max-sessions', type=int,
+                                           default=10000)
+    commands.choices['serve'].add_argument('--cache',
+                                           help='position cache file')
+    commands.choices['serve'].add_argument('--hint-ms', type=float,
+                                           help='milliseconds of search of '
+                                                'a hint, default the first '
+                                                'legal move')
+    commands.choices['load'].add_argument('--clients', type=int, default=100)
+    commands.choices['load'].add_argument('--steps', type=int, default=100)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        cache = None if args.cache is None else PositionCache(args.cache)
+        server = GameServer(args.idle_timeout, args.max_sessions,
+                            cache=cache,
+                            hint_budget=None if args.hint_ms is None else
+                            args.hint_ms / 1000)
+        try:
+            asyncio.run(server.serve(args.host, args.port, args.unix))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if cache is not None:
+                cache.close()
+    else:
+        res = asyncio.run(load_test(args.clients, args.steps, args.host,
+                                    args.port, args.unix))
+        for command, stats in res.items():
+            print('{:>5} count={:<7} p50={:.3f}ms p99={:.3f}ms'.format(
+                command, stats['count'], stats['p50'], stats['p99']))
+
+
+if __name__ == '__main__':
+    main()
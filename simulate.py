@@ -0,0 +1,212 @@
+from deck import DeckGenerator
+from logic import TableCard, GameLogic
+from state import EMPTY, PYRAMID
+from dead import Detector
+from multiprocessing import Pool, cpu_count
+from random import Random
+import argparse
+import json
+import sys
+
+
+def kings_first(game_logic, rng):
+    """First legal move like the '?' hint: kings, then pairs."""
+    for move in game_logic.legal_moves():
+        return move
+
+
+def greedy(game_logic, rng):
+    """Move which removes most pyramid cards, lowest rows first."""
+    state = game_logic.state
+    best, best_score = None, None
+    for move in game_logic.legal_moves():
+        rows = [game_logic.cardIndex(card)[0] for card in move
+                if state.locate(card.id)[0] == PYRAMID]
+        score = (len(rows), max(rows, default=-1))
+        if best_score is None or score > best_score:
+            best, best_score = move, score
+    return best
+
+
+def random_policy(game_logic, rng):
+    """Random legal move or draw."""
+    moves = list(game_logic.legal_moves())
+    moves.append(None)
+    return rng.choice(moves)
+
+
+POLICIES = {'greedy': greedy, 'kings': kings_first, 'random': random_policy}
+
+
+class Stats:
+    """Summary of simulated games, can be merged."""
+
+    FIELDS = ('games', 'wins', 'cleared', 'removed', 'moves', 'passes')
+
+    def __init__(self, **values):
+        """
+        Initializing class.
+        games - count of games; wins - count of cleared pyramids;
+        cleared - removed pyramid cards; removed - all removed cards;
+        moves - moves made, draws included; passes - passes through stock
+        """
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field, 0))
+
+    def add_game(self, won, cleared, removed, moves, passes=0):
+        """Add result of one game."""
+        self.games += 1
+        self.wins += int(won)
+        self.cleared += cleared
+        self.removed += removed
+        self.moves += moves
+        self.passes += passes
+
+    def merge(self, other):
+        """Add results of other Stats object."""
+        for field in self.FIELDS:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        return self
+
+    @property
+    def win_rate(self):
+        """Return share of won games."""
+        return self.wins / self.games if self.games else 0.0
+
+    @property
+    def avg_cleared(self):
+        """Return average count of removed pyramid cards."""
+        return self.cleared / self.games if self.games else 0.0
+
+    def to_dict(self):
+        """Return fields and averages as dict."""
+        res = {field: getattr(self, field) for field in self.FIELDS}
+        res['win_rate'] = self.win_rate
+        res['avg_cleared'] = self.avg_cleared
+        return res
+
+    def __str__(self):
+        return 'Stats: Games-{}; Win rate-{:.4f}; Avg cleared-{:.2f}'\
+            .format(self.games, self.win_rate, self.avg_cleared)
+
+
+def game_seed(seed, index):
+    """Return deal seed of game number index, same for any chunking."""
+    return seed << 32 | index
+
+
+def play(game_logic, policy, rng, max_moves=1000, detector=None):
+    """Play game until pyramid is cleared, no cards move during a full pass
+    of the stock or max_moves is reached.
+    :param detector: dead.Detector, game is stopped as lost as soon as it
+                     cannot be won; None - play it out
+    :return: (won, cleared pyramid cards, removed cards, moves, passes
+              through stock)"""
+    state = game_logic.state
+    pyramid_size = len(state.pyramid)
+    start_cards = pyramid_size + state.stock_size + state.waste_size
+    idle = 0  # draws since last removed card
+    moves = 0
+    if detector is not None and detector.is_dead(state):
+        max_moves = 0
+    while not state.won and moves < max_moves:
+        move = policy(game_logic, rng)
+        moves += 1
+        if move is None:
+            if game_logic.card_from_additional_deck is None:
+                break
+            idle += 1
+            if idle > state.stock_size + state.waste_size:
+                break
+        else:
+            game_logic.compare_card(*move)
+            idle = 0
+            if detector is not None and \
+                    detector.is_dead(state, [card.id for card in move]):
+                break
+    cleared = state.pyramid.count(EMPTY)
+    removed = start_cards - state.stock_size - state.waste_size - \
+        (pyramid_size - cleared)
+    return state.won, cleared, removed, moves, state.passes
+
+
+def run_games(level, policy, seed, start, count, deck_count=1,
+              max_moves=1000, max_passes=None, prune=False):
+    """Play count games from game number start.
+    :param max_passes: passes through the stock, None - unlimited
+    :param prune: stop games which cannot be won, see dead.Detector
+    :return: Stats object"""
+    stats = Stats()
+    policy_ = POLICIES[policy]
+    detector = Detector(level) if prune else None
+    for index in range(start, start + count):
+        game_seed_ = game_seed(seed, index)
+        deck = DeckGenerator(deck_count)
+        deck.shuffle(seed=game_seed_)
+        table = TableCard(deck)
+        table.generate_pyramid()
+        game_logic = GameLogic(table, max_passes=max_passes)
+        game_logic.level = level
+        game_logic.card_from_additional_deck
+        stats.add_game(*play(game_logic, policy_, Random(game_seed_),
+                             max_moves, detector))
+    return stats
+
+
+def _run_chunk(args):
+    """Pool worker: run_games with tuple of arguments."""
+    return run_games(*args)
+
+
+def simulate(games, level='easy', policy='greedy', seed=0, workers=None,
+             chunk=10000, deck_count=1, max_moves=1000, max_passes=None,
+             prune=False):
+    """Play games on all cores, yield merged Stats after every chunk.
+    Results do not depend on count of workers or order of chunks."""
+    assert level in ('easy', 'hard'), 'incorrect level'
+    assert policy in POLICIES, 'incorrect policy'
+    assert games >= 0 and chunk > 0, 'incorrect games or chunk'
+
+    tasks = [(level, policy, seed, start, min(chunk, games - start),
+              deck_count, max_moves, max_passes, prune)
+             for start in range(0, games, chunk)]
+    total = Stats()
+    workers = workers or cpu_count()
+    if workers == 1:
+        for task in tasks:
+            yield total.merge(_run_chunk(task))
+        return
+    with Pool(workers) as pool:
+        for stats in pool.imap_unordered(_run_chunk, tasks):
+            yield total.merge(stats)
+
+
+def main(argv=None):
+    """Command line: print partial results and final JSON."""
+    parser = argparse.ArgumentParser(description='Monte Carlo win rates')
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--level', choices=['easy', 'hard'], default='easy')
+    parser.add_argument('--policy', choices=sorted(POLICIES),
+                        default='greedy')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--chunk', type=int, default=10000)
+    parser.add_argument('--decks', type=int, default=1)
+    parser.add_argument('--max-moves', type=int, default=1000)
+    parser.add_argument('--max-passes', type=int, default=None,
+                        help='passes through the stock, default unlimited')
+    parser.add_argument('--prune', action='store_true',
+                        help='stop games as soon as they cannot be won')
+    args = parser.parse_args(argv)
+
+    stats = Stats()
+    for stats in simulate(args.games, args.level, args.policy, args.seed,
+                          args.workers, args.chunk, args.decks,
+                          args.max_moves, args.max_passes, args.prune):
+        print(stats, file=sys.stderr)
+    print(json.dumps(dict(stats.to_dict(), level=args.level,
+                          policy=args.policy, seed=args.seed)))
+
+
+if __name__ == '__main__':
+    main()
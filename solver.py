@@ -0,0 +1,409 @@
+from deck import DeckGenerator
+from logic import TableCard, GameLogic
+from dead import Detector
+from cache import LOST, WON, PositionCache, position_key
+from rules import rule_set
+from state import EMPTY, FACES, PYRAMID, TARGET, row_col
+from itertools import chain, combinations, product
+from time import perf_counter
+import argparse
+import json
+import sys
+
+_END = object()  # end of moves of position
+
+
+class Solver:
+    """Depth-first search for a won game.
+
+    Stock is recycled without limit and every card of stock and waste
+    becomes the top of waste during one pass, so the search treats them
+    as one pool of playable cards; drawing is added back when the
+    solution is written out. A position is then given by the set of
+    removed cards, which is the key of the transposition table. Single
+    card moves (kings) are dominant and played alone; other moves are
+    tried by count of pyramid cards they remove, lowest rows first.
+    A state with pass limit is searched draw by draw instead. Positions
+    with a dead pyramid card (see dead.Detector) are not searched.
+    """
+
+    def __init__(self, level='easy', target=TARGET, aces_high=False,
+                 max_nodes=1000000, time_limit=None, cache=None, rules=None):
+        """
+        Initializing class.
+        :param level: 'easy' or 'hard' (pairs of the same suit)
+        :param target: sum of values of removed cards
+        :param aces_high: ace value is 14
+        :param max_nodes: limit of searched positions, None - no limit
+        :param time_limit: limit of search time in seconds, None - no limit
+        :param cache: cache.PositionCache of solved positions, None - no
+                      cache
+        :param rules: RuleSet used instead of level, target and ace value
+        nodes - positions searched by the last solve, passes - stock
+        passes of found solution, cleared - most pyramid cards removed in
+        one line of the search
+        """
+        if rules is None:
+            rules = rule_set(level, target, aces_high)
+        self._rules = rules
+        self._level = rules.level
+        self._target = rules.target
+        self._aces_high = rules.aces_high
+        # stock and waste cards of faces with the same moves are equal,
+        # class of face is the first of them
+        singles = frozenset(rules.faces[0])
+        first = {}
+        self._face_classes = [
+            first.setdefault((face in singles, rules.partners[face]), face)
+            for face in range(FACES)]
+        self._max_nodes = max_nodes
+        self._time_limit = time_limit
+        self._detector = Detector(rules=rules)
+        self._cache = cache
+        self._deadline = None
+        self.nodes = 0
+        self.passes = 0
+        self.cleared = 0
+
+    @classmethod
+    def of_game(cls, game_logic, **limits):
+        """Return solver of rules of GameLogic object."""
+        return cls(rules=game_logic.rules, **limits)
+
+    def _moves(self, state):
+        """Return list of ordered moves of position: tuples of card ids,
+        stock and waste cards are taken from any position."""
+        pyramid = state.pyramid
+        open_ = {}  # face -> open pyramid card ids
+        for slot_ in state.open_slots():
+            open_.setdefault(pyramid[slot_] % FACES, []).append(pyramid[slot_])
+        # face -> one stock or waste card id, cards of one class are equal
+        pool = {}
+        classes = self._classes
+        by_class = {}
+        for card_id in chain(state.stock, state.waste):
+            card_id = by_class.setdefault(classes[card_id], card_id)
+            pool.setdefault(card_id % FACES, card_id)
+        singles, pairs = self._rules.faces
+        for face in singles:
+            if face in open_:
+                return [(open_[face][0],)]  # dominant, nothing else is tried
+            if face in pool:
+                return [(pool[face],)]
+
+        moves = []
+        for face, other in pairs:
+            cards = open_.get(face, ())
+            others = open_.get(other, ())
+            if face == other:
+                moves.extend(combinations(cards, 2))
+            else:
+                moves.extend(product(cards, others))
+            if face in pool:
+                moves.extend((pool[face], card_id) for card_id in others)
+            if other in pool and face != other:
+                moves.extend((pool[other], card_id) for card_id in cards)
+
+        moves.sort(key=lambda move: self._order(state, move))
+        return moves
+
+    def _drawing_moves(self, state):
+        """Return list of ordered legal moves of position with pass limit,
+        None is draw."""
+        singles, _ = self._rules.faces
+        for face in singles:
+            for card_id in state.playable(face):
+                return [(card_id,)]  # dominant, nothing else is tried
+        moves = sorted(state.moves(faces=self._rules.faces),
+                       key=lambda move: self._order(state, move))
+        if state.can_draw:
+            moves.append(None)
+        return moves
+
+    @staticmethod
+    def _order(state, move):
+        """Sort key of move: more pyramid cards, then lower rows first."""
+        rows = [row_col(location[1])[0] for location in
+                map(state.locate, move) if location[0] == PYRAMID]
+        return -len(rows), -max(rows, default=-1)
+
+    def solve(self, state, draws=True):
+        """Search won game from position. Without pass limit of the state
+        stock and waste cards are a pool, with it draws are searched move
+        by move and the pass number is part of the position. Cached
+        positions are not searched, every position of a found solution
+        and a lost start position are cached; the time limit covers
+        caching of a solution with draws too, so a part of it may be
+        cached.
+        :param state: GameState object, it is not changed
+        :param draws: False - return solution without pass limit as it is
+                      found, stock and waste cards are removed from any
+                      position; draws are added to it only for the cache,
+                      see draws
+        :return: (True, list of moves) if game can be won, (False, []) if
+                 it cannot, (None, []) if a limit was reached; move is
+                 tuple of removed card ids or None for drawing a card"""
+        self._deadline = None if self._time_limit is None else \
+            perf_counter() + self._time_limit
+        if self._cache is None:
+            return self._search(state, draws)
+        res = self._cached(state)
+        if res is None:
+            res = self._search(state, draws)
+            if draws or not res[0]:
+                self._store(state, *res)
+            else:
+                # positions of a pool solution are cached with draws in
+                # full, it takes time linear in the solution length
+                passes, self._deadline = self.passes, None
+                self._store(state, True, self._with_draws(state, res[1]))
+                self.passes = passes
+        return res
+
+    def _timeout(self):
+        """Return True if time limit of solve is reached."""
+        return self._deadline is not None and perf_counter() > self._deadline
+
+    def _key(self, state):
+        """Return cache key of position."""
+        return position_key(state, self._level, self._target,
+                            self._aces_high)
+
+    def _cached(self, state):
+        """Return result of solve from cache or None if it is not known."""
+        entry = self._cache.get(self._key(state))
+        if entry is None:
+            return None
+        self.nodes = 0
+        self.passes = state.passes
+        self.cleared = sum(card_id == EMPTY for card_id in state.pyramid)
+        if entry.result == LOST:
+            return False, []
+        # solution is the chain of cached moves
+        distance = entry.distance
+        state = state.copy()
+        moves = []
+        while not state.won:
+            if entry is None or entry.result != WON or \
+                    len(moves) >= distance or self._timeout():
+                return None
+            moves.append(entry.move)
+            self._apply(state, entry.move)
+            entry = self._cache.get(self._key(state))
+        self.passes = state.passes
+        self.cleared = len(state.pyramid)
+        return True, moves
+
+    def _store(self, state, solvable, moves):
+        """Cache result of solve of position."""
+        if solvable is None:
+            return
+        if not solvable:
+            self._cache.put(self._key(state), LOST)
+            return
+        state = state.copy()
+        for index, move in enumerate(moves):
+            if self._timeout():
+                break
+            self._cache.put(self._key(state), WON, move, len(moves) - index)
+            self._apply(state, move)
+
+    def _search(self, state, draws=True):
+        """Search won game from position, see solve."""
+        start = state
+        state = state.copy()
+        pyramid_size = len(state.pyramid)
+        self.nodes = 0
+        self.passes = state.passes
+        self.cleared = pyramid_size - sum(card_id != EMPTY
+                                          for card_id in state.pyramid)
+        if state.won:
+            return True, []
+        top = max(chain(state.pyramid, state.stock, state.waste, (0,)))
+        self._card_count = (top // FACES + 1) * FACES
+        self._classes = [self._face_classes[card_id % FACES]
+                         for card_id in range(self._card_count)]
+        # bits of count of removed cards of a class in position key
+        copies = max(self._face_classes.count(face)
+                     for face in self._face_classes)
+        self._talon_bits = (copies * self._card_count // FACES).bit_length()
+        if self._detector.is_dead(state):
+            return False, []
+        limited = state.max_passes is not None
+        moves_of = self._drawing_moves if limited else self._moves
+        # position key without pass limit: removed pyramid cards and counts
+        # of removed stock and waste cards of every class
+        pyramid_mask = sum(1 << card_id for card_id in state.pyramid
+                           if card_id != EMPTY)
+        talon = 0
+        seen = {(state.hash, state.passes) if limited else
+                (state.removed & pyramid_mask, talon)}
+        path = []  # (move, undo information) of the current line
+        stack = [iter(moves_of(state))]
+        cleared = self.cleared
+        while stack:
+            move = next(stack[-1], _END)
+            if move is _END:
+                stack.pop()
+                if path:
+                    move, undo = path.pop()
+                    cleared -= self._undo(state, move, undo)
+                    talon -= self._talon_key(undo)
+                continue
+            undo = self._apply(state, move)
+            self.nodes += 1
+            if state.won:
+                path.append((move, undo))
+                self.cleared = pyramid_size
+                moves = [move for move, undo in path]
+                if limited or not draws:
+                    self.passes = state.passes
+                    return True, moves
+                moves = self._with_draws(start, moves)
+                return (None, []) if moves is None else (True, moves)
+            if limited:
+                key = state.hash, state.passes
+            else:
+                key = state.removed & pyramid_mask, \
+                    talon + self._talon_key(undo)
+            if key in seen:
+                self._undo(state, move, undo)
+                continue
+            seen.add(key)
+            if move is not None and self._detector.is_dead(state, move):
+                self._undo(state, move, undo)
+                continue
+            talon += self._talon_key(undo)
+            cleared += self._pyramid_count(undo)
+            if cleared > self.cleared:
+                self.cleared = cleared
+            if self._max_nodes is not None and self.nodes >= self._max_nodes \
+                    or self._timeout():
+                return None, []
+            path.append((move, undo))
+            stack.append(iter(moves_of(state)))
+        return False, []
+
+    @staticmethod
+    def _apply(state, move):
+        """Apply move to state.
+        :return: recycled flag of draw, list of (card id, zone, position)
+                 of removed cards"""
+        if move is None:
+            recycled = not state.stock_size
+            state.draw()
+            return recycled
+        return [(card_id,) + state.remove(card_id) for card_id in move]
+
+    @staticmethod
+    def _pyramid_count(undo):
+        """Return count of pyramid cards removed by applied move."""
+        if undo is True or undo is False:
+            return 0
+        return sum(zone == PYRAMID for card_id, zone, pos in undo)
+
+    def _talon_key(self, undo):
+        """Return change of position key by stock and waste cards of
+        removed cards."""
+        if undo is True or undo is False:
+            return 0
+        return sum(1 << self._classes[card_id] * self._talon_bits
+                   for card_id, zone, pos in undo if zone != PYRAMID)
+
+    def _undo(self, state, move, undo):
+        """Undo applied move.
+        :return: count of pyramid cards returned"""
+        if move is None:
+            state.undo_draw(undo)
+            return 0
+        for card_id, zone, pos in reversed(undo):
+            state.restore(card_id, zone, pos)
+        return self._pyramid_count(undo)
+
+    def _with_draws(self, state, moves):
+        """Return moves with draws, see draws; passes are counted. None
+        if time limit is reached."""
+        state = state.copy()
+        res = []
+        for move in self.draws(state, moves):
+            if self._timeout():
+                return None
+            res.append(move)
+        self.passes = state.passes
+        return res
+
+    @staticmethod
+    def draws(state, moves):
+        """Generate moves with draws (None) which bring every stock or
+        waste card to the top of waste before it is removed. Every move is
+        applied to state when the next one is generated, so state is the
+        position of the generated move.
+        :param state: GameState object of the first move, it is changed
+        :param moves: solution of solve(state, draws=False)"""
+        for move in moves:
+            if move is not None:
+                for card_id in move:
+                    if state.locate(card_id)[0] == PYRAMID:
+                        continue
+                    while state.waste_top != card_id:
+                        yield None
+                        state.draw()
+            yield move
+            if move is None:
+                state.draw()
+            else:
+                for card_id in move:
+                    state.remove(card_id)
+
+
+def solve(game_logic, max_nodes=1000000, time_limit=None):
+    """Search won game from position of GameLogic object, see
+    Solver.solve."""
+    solver = Solver.of_game(game_logic, max_nodes=max_nodes,
+                            time_limit=time_limit)
+    return solver.solve(game_logic.state)
+
+
+def main(argv=None):
+    """Command line: solve seeded deals and print summary JSON."""
+    parser = argparse.ArgumentParser(description='Pyramid solver')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--level', choices=['easy', 'hard'], default='easy')
+    parser.add_argument('--decks', type=int, default=1)
+    parser.add_argument('--max-nodes', type=int, default=1000000)
+    parser.add_argument('--time-limit', type=float)
+    parser.add_argument('--max-passes', type=int,
+                        help='passes through the stock, default unlimited')
+    parser.add_argument('--cache', help='position cache file')
+    args = parser.parse_args(argv)
+
+    res = {True: 0, False: 0, None: 0}
+    nodes = 0
+    cache = None if args.cache is None else PositionCache(args.cache)
+    solver = Solver(args.level, max_nodes=args.max_nodes,
+                    time_limit=args.time_limit, cache=cache)
+    start = perf_counter()
+    for index in range(args.games):
+        deck = DeckGenerator(args.decks)
+        deck.shuffle(args.seed << 32 | index)
+        table = TableCard(deck)
+        table.generate_pyramid()
+        game_logic = GameLogic(table, max_passes=args.max_passes)
+        game_logic.card_from_additional_deck
+        solvable, moves = solver.solve(game_logic.state)
+        res[solvable] += 1
+        nodes += solver.nodes
+        print('deal {}: {} nodes={}'.format(index, solvable, solver.nodes),
+              file=sys.stderr)
+    seconds = perf_counter() - start
+    if cache is not None:
+        cache.close()
+    print(json.dumps({'games': args.games, 'solvable': res[True],
+                      'unsolvable': res[False], 'unknown': res[None],
+                      'nodes': nodes,
+                      'nodes_per_second': nodes / seconds if seconds else 0}))
+
+
+if __name__ == '__main__':
+    main()
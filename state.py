@@ -0,0 +1,627 @@
+from array import array
+from functools import lru_cache
+from itertools import combinations
+from random import Random
+
+EMPTY = -1  # removed card slot
+
+# card location zones
+PYRAMID = 0
+STOCK = 1
+WASTE = 2
+
+FACES = 52  # card faces in one deck (4 suits * 13 ranks)
+RANKS = 13  # ranks in one suit, card value is rank index + 1
+TARGET = 13  # default sum of values of removed cards
+MAX_CARDS = 4096  # bound of card ids and positions, see journal
+UNKNOWN = 255  # analysis value that is not known, fits one byte
+
+
+def rank_values(aces_high=False):
+    """Return values of ranks A...K, ace is 14 if aces_high."""
+    return (RANKS + 1 if aces_high else 1,) + tuple(range(2, RANKS + 1))
+
+
+@lru_cache(maxsize=None)
+def move_faces(target=TARGET, aces_high=False, suited=False):
+    """Return (faces removed alone, pairs of faces removed together) of
+    rules; pair faces are ordered, equal faces mean two copies of it."""
+    values = rank_values(aces_high)
+    singles = tuple(face for face in range(FACES)
+                    if values[face % RANKS] == target)
+    pairs = tuple((face, other) for face in range(FACES)
+                  for other in range(face, FACES)
+                  if values[face % RANKS] + values[other % RANKS] == target
+                  and (not suited or face // RANKS == other // RANKS))
+    return singles, pairs
+
+
+class Zobrist:
+    """Random 64-bit keys for incremental position hashing."""
+
+    def __init__(self, seed=0x5eed):
+        """
+        Initializing class.
+        :param seed: seed of the keys generator
+        _keys - keys of every zone, FACES keys per position
+        """
+        self._seed = seed
+        self._random = {zone: Random('{}:{}'.format(seed, zone))
+                        for zone in (PYRAMID, STOCK, WASTE)}
+        self._keys = {zone: [] for zone in (PYRAMID, STOCK, WASTE)}
+
+    def key(self, zone, pos, card_id):
+        """Return key of card on position of zone.
+        :param zone: PYRAMID, STOCK or WASTE
+        :param pos: position in the zone
+        :param card_id: card id, copies of one face share a key"""
+        keys = self._keys[zone]
+        index = pos * FACES + card_id % FACES
+        if index >= len(keys):
+            random = self._random[zone]
+            keys.extend(random.getrandbits(64)
+                        for _ in range(index + FACES - len(keys)))
+        return keys[index]
+
+    def table(self, zone, positions):
+        """Return flat list of keys of zone, index is position * FACES +
+        face, with keys of positions 0...positions - 1. The list is
+        extended in place, so it can be kept."""
+        keys = self._keys[zone]
+        if len(keys) < positions * FACES:
+            self.key(zone, positions - 1, FACES - 1)
+        return keys
+
+
+ZOBRIST = Zobrist()
+# flat key tables of ZOBRIST, GameState generates keys of its positions
+_PYRAMID_KEYS, _STOCK_KEYS, _WASTE_KEYS = (
+    ZOBRIST.table(zone, 0) for zone in (PYRAMID, STOCK, WASTE))
+
+
+def slot(row, col):
+    """Return pyramid slot index of (row, col)."""
+    return row * (row + 1) // 2 + col
+
+
+_ROW_COL = []  # (row, col) of every pyramid slot index
+
+
+def row_col(slot_):
+    """Return (row, col) of pyramid slot index."""
+    if slot_ >= len(_ROW_COL):
+        row = _ROW_COL[-1][0] + 1 if _ROW_COL else 0
+        while len(_ROW_COL) <= slot_:
+            _ROW_COL.extend((row, col) for col in range(row + 1))
+            row += 1
+    return _ROW_COL[slot_]
+
+
+_PARENTS = []  # slots covered by every pyramid slot
+
+
+def parents(slot_):
+    """Return tuple of pyramid slots covered by slot."""
+    while len(_PARENTS) <= slot_:
+        row, col = row_col(len(_PARENTS))
+        _PARENTS.append(tuple(slot(row - 1, c) for c in (col - 1, col)
+                              if row and 0 <= c < row))
+    return _PARENTS[slot_]
+
+
+@lru_cache(maxsize=None)
+def _full_covers(rows):
+    """Return (cover counts, open slots) of pyramid without removed
+    cards."""
+    size = slot(rows, 0)
+    covers = array('b', [2]) * slot(rows - 1, 0) + array('b', [0]) * rows
+    return covers, frozenset(range(size - rows, size))
+
+
+def _talon_hash(cards, keys, start=0):
+    """Return xor of keys of cards from start position of stock or waste
+    array."""
+    res = 0
+    for pos in range(start, len(cards)):
+        res ^= keys[pos * FACES + cards[pos] % FACES]
+    return res
+
+
+class GameState:
+    """Compact game position.
+
+    Pyramid is an array of card ids, removed cards are kept in a bitmask.
+    Card id is deck_number * 52 + face, where face is suit_index * 13 +
+    rank_index. Stock and waste are two arrays, top card is last: drawing
+    moves the stock top to the waste top, recycling swaps the roles of the
+    arrays, so the waste becomes the stock in the same order. Both are
+    O(1), and removing the waste top is a pop. The 64-bit Zobrist hash
+    is kept per part, every talon array is hashed as stock and as waste,
+    so a recycle changes no key; copies of one face hash the same.
+    Location index (_zones, _positions by card id) gives zone and position
+    of every card without scanning. Every pyramid slot keeps count of
+    cards covering it; removing or returning a card updates only the two
+    slots it covers and the set of open slots. Playable cards (open
+    pyramid cards and top waste card) are kept in buckets by face, so
+    legal moves are found by looking up complement buckets. Buckets and
+    talon hashes of the other role are built when first needed, so
+    dealing does only the work every game needs.
+    """
+
+    __slots__ = ('_rows', '_pyramid', '_talon', '_stock_side', '_recycles',
+                 '_max_passes', '_removed', '_pyramid_hash', '_talon_hashes',
+                 '_zones', '_positions', '_covers', '_open', '_buckets',
+                 '_top')
+
+    def __init__(self, pyramid, stock, waste=(), rows=7, max_passes=None):
+        """
+        Initializing class.
+        :param pyramid: card ids of pyramid slots, row by row
+        :param stock: card ids of stock, top card is last; an array('h')
+                      is used in place when waste is empty
+        :param waste: card ids of waste, top card is last
+        :param rows: count of pyramid rows
+        :param max_passes: limit of passes through the stock, None - no
+                           limit
+        _talon - two arrays of stock and waste cards, _stock_side - index
+        of the stock in _talon, _recycles - count of stock refills,
+        _talon_hashes - hashes of every _talon array keyed as stock and
+        as waste, None - not computed yet; _buckets - sets of playable
+        card ids by face, None - not built yet
+        """
+        assert isinstance(rows, int) and rows > 0, 'incorrect rows count'
+        assert len(pyramid) == slot(rows, 0), 'incorrect pyramid length'
+        assert len(pyramid) + len(stock) + len(waste) <= MAX_CARDS, \
+            'too many cards'
+
+        self._rows = rows
+        self._pyramid = array('h', pyramid)
+        if not isinstance(stock, array) or stock.typecode != 'h':
+            stock = array('h', stock)
+        self._talon = [stock, array('h', waste)]
+        self._stock_side = 0
+        self._recycles = 0
+        self._max_passes = max_passes
+        self._removed = 0
+        talon = len(stock) + len(waste)
+        ZOBRIST.table(PYRAMID, len(self._pyramid))
+        ZOBRIST.table(STOCK, talon)
+        ZOBRIST.table(WASTE, talon)
+        self._pyramid_hash = self._full_pyramid_hash()
+        # stock keyed as stock, waste keyed as waste
+        self._talon_hashes = [_talon_hash(stock, _STOCK_KEYS), None, None,
+                              _talon_hash(self._talon[1], _WASTE_KEYS)]
+        self._build_index()
+        assert len(self._zones) <= MAX_CARDS, 'too large card id'
+        self._build_covers()
+
+    def _build_covers(self):
+        """Fill cover counts and open slots of the pyramid."""
+        pyramid = self._pyramid
+        self._buckets = None
+        waste = self._talon[1]
+        self._top = waste[-1] if waste else EMPTY
+        if EMPTY not in pyramid:
+            covers, open_ = _full_covers(self._rows)
+            self._covers = array('b', covers)
+            self._open = set(open_)
+            return
+        self._covers = array('b', [0]) * len(pyramid)
+        for slot_, card_id in enumerate(pyramid):
+            if card_id != EMPTY:
+                for parent in parents(slot_):
+                    self._covers[parent] += 1
+        self._open = {slot_ for slot_, card_id in enumerate(pyramid)
+                      if card_id != EMPTY and not self._covers[slot_]}
+
+    def _build_buckets(self):
+        """Fill buckets of playable cards, return them."""
+        self._buckets = buckets = [set() for _ in range(FACES)]
+        pyramid = self._pyramid
+        for slot_ in self._open:
+            buckets[pyramid[slot_] % FACES].add(pyramid[slot_])
+        if self._top != EMPTY:
+            buckets[self._top % FACES].add(self._top)
+        return buckets
+
+    def _open_slot(self, slot_):
+        """Mark pyramid slot as open and its card as playable."""
+        self._open.add(slot_)
+        if self._buckets is not None:
+            card_id = self._pyramid[slot_]
+            self._buckets[card_id % FACES].add(card_id)
+
+    def _close_slot(self, slot_, card_id):
+        """Mark pyramid slot as closed and its card as not playable."""
+        if slot_ in self._open:
+            self._open.discard(slot_)
+            if self._buckets is not None:
+                self._buckets[card_id % FACES].discard(card_id)
+
+    def _sync_top(self):
+        """Update playable top card of waste."""
+        waste = self._talon[self._stock_side ^ 1]
+        top = waste[-1] if waste else EMPTY
+        if top != self._top:
+            buckets = self._buckets
+            if buckets is not None:
+                if self._top != EMPTY:
+                    buckets[self._top % FACES].discard(self._top)
+                if top != EMPTY:
+                    buckets[top % FACES].add(top)
+            self._top = top
+
+    def _build_index(self):
+        """Fill location index of all cards on the table."""
+        size = max(max(cards, default=EMPTY) for cards in
+                   (self._pyramid,) + tuple(self._talon)) + 1
+        zones = [EMPTY] * size
+        positions = [EMPTY] * size
+        for pos, card_id in enumerate(self._pyramid):
+            if card_id != EMPTY:
+                zones[card_id] = PYRAMID
+                positions[card_id] = pos
+        for side, cards in enumerate(self._talon):
+            for pos, card_id in enumerate(cards):
+                zones[card_id] = STOCK + side
+                positions[card_id] = pos
+        self._zones = array('b', zones)
+        self._positions = array('h', positions)
+
+    def _index_tail(self, side, start):
+        """Update location index of cards from start position of _talon
+        array side; zone of them in the index is STOCK + side."""
+        zones = self._zones
+        positions = self._positions
+        cards = self._talon[side]
+        for pos in range(start, len(cards)):
+            zones[cards[pos]] = STOCK + side
+            positions[cards[pos]] = pos
+
+    def _full_pyramid_hash(self):
+        """Compute hash of pyramid from scratch."""
+        keys = _PYRAMID_KEYS
+        res = 0
+        for index, card_id in zip(range(0, len(keys), FACES),
+                                  self._pyramid):
+            if card_id != EMPTY:
+                res ^= keys[index + card_id % FACES]
+        return res
+
+    def _rehash_tail(self, side, start):
+        """Xor keys of cards from start position of _talon array side,
+        keyed as stock and as waste, into its computed hashes."""
+        cards = self._talon[side]
+        hashes = self._talon_hashes
+        for index, keys in ((2 * side, _STOCK_KEYS),
+                            (2 * side + 1, _WASTE_KEYS)):
+            if hashes[index] is not None:
+                hashes[index] ^= _talon_hash(cards, keys, start)
+
+    def _swap_sides(self):
+        """Swap roles of stock and waste arrays, compute hashes of the new
+        roles if they are not known."""
+        self._stock_side ^= 1
+        hashes = self._talon_hashes
+        for side, index, keys in ((self._stock_side, 0, _STOCK_KEYS),
+                                  (self._stock_side ^ 1, 1, _WASTE_KEYS)):
+            if hashes[2 * side + index] is None:
+                hashes[2 * side + index] = _talon_hash(self._talon[side],
+                                                       keys)
+
+    def _full_hash(self):
+        """Compute hash from scratch: pyramid cards, stock and waste cards
+        by position from the bottom."""
+        key = ZOBRIST.key
+        res = self._full_pyramid_hash()
+        for pos, card_id in enumerate(self.stock):
+            res ^= key(STOCK, pos, card_id)
+        for pos, card_id in enumerate(self.waste):
+            res ^= key(WASTE, pos, card_id)
+        return res
+
+    @property
+    def rows(self):
+        """Return count of pyramid rows."""
+        return self._rows
+
+    @property
+    def pyramid(self):
+        """Return pyramid slots array."""
+        return self._pyramid
+
+    @property
+    def stock(self):
+        """Return new array of stock cards, top card is last."""
+        return self._talon[self._stock_side][:]
+
+    @property
+    def waste(self):
+        """Return new array of waste cards, top card is last."""
+        return self._talon[self._stock_side ^ 1][:]
+
+    @property
+    def stock_size(self):
+        """Return count of stock cards."""
+        return len(self._talon[self._stock_side])
+
+    @property
+    def waste_size(self):
+        """Return count of waste cards."""
+        return len(self._talon[self._stock_side ^ 1])
+
+    @property
+    def waste_top(self):
+        """Return top card of waste or EMPTY."""
+        waste = self._talon[self._stock_side ^ 1]
+        return waste[-1] if waste else EMPTY
+
+    @property
+    def passes(self):
+        """Return number of current pass through the stock, from 1."""
+        return self._recycles + 1
+
+    @property
+    def max_passes(self):
+        """Return limit of passes through the stock or None."""
+        return self._max_passes
+
+    @max_passes.setter
+    def max_passes(self, max_passes):
+        """Set limit of passes through the stock, None - no limit."""
+        assert max_passes is None or max_passes > 0, 'incorrect pass limit'
+        self._max_passes = max_passes
+
+    @property
+    def can_draw(self):
+        """Check if draw moves a card: stock is not empty or waste can be
+        recycled within pass limit."""
+        stock_side = self._stock_side
+        return bool(self._talon[stock_side]) or \
+            bool(self._talon[stock_side ^ 1]) and (
+                self._max_passes is None or
+                self._recycles + 1 < self._max_passes)
+
+    @property
+    def id_bound(self):
+        """Return bound of card ids, every card of the state is less."""
+        return len(self._zones)
+
+    @property
+    def removed(self):
+        """Return bitmask of removed card ids."""
+        return self._removed
+
+    @property
+    def hash(self):
+        """Return 64-bit Zobrist hash."""
+        hashes = self._talon_hashes
+        stock_side = self._stock_side
+        return self._pyramid_hash ^ hashes[2 * stock_side] ^ \
+            hashes[3 - 2 * stock_side]
+
+    @property
+    def won(self):
+        """Return True if pyramid is cleared."""
+        return self._pyramid[0] == EMPTY
+
+    def is_removed(self, card_id):
+        """Check if card was removed."""
+        return bool(self._removed >> card_id & 1)
+
+    def is_open(self, slot_):
+        """Check if pyramid slot is not covered by other cards."""
+        return not self._covers[slot_]
+
+    def open_slots(self):
+        """Return sorted list of pyramid slots with uncovered cards."""
+        return sorted(self._open)
+
+    def locate(self, card_id):
+        """Return (zone, position) of card or None."""
+        if card_id >= len(self._zones):
+            return None
+        zone = self._zones[card_id]
+        if zone == EMPTY:
+            return None
+        if zone != PYRAMID:
+            zone = STOCK if zone - STOCK == self._stock_side else WASTE
+        return zone, self._positions[card_id]
+
+    def location(self, card_id):
+        """Return (zone, row, col) of card or None. Stock and waste cards
+        have row 0 and their position as col."""
+        location = self.locate(card_id)
+        if location is None:
+            return None
+        zone, pos = location
+        if zone == PYRAMID:
+            return (zone,) + row_col(pos)
+        return zone, 0, pos
+
+    def remove(self, card_id):
+        """Remove card from table.
+        :return: (zone, position) where card was"""
+        location = self.locate(card_id)
+        if location is None:
+            raise ValueError('card is not on the table')
+        zone, pos = location
+        if zone == PYRAMID:
+            cards = self._pyramid
+            self._pyramid_hash ^= _PYRAMID_KEYS[pos * FACES + card_id % FACES]
+            self._close_slot(pos, card_id)
+            cards[pos] = EMPTY
+            covers = self._covers
+            for parent in parents(pos):
+                covers[parent] -= 1
+                if not covers[parent] and cards[parent] != EMPTY:
+                    self._open_slot(parent)
+        else:
+            # positions after card move down, the waste top is the last
+            side = self._zones[card_id] - STOCK
+            self._rehash_tail(side, pos)
+            del self._talon[side][pos]
+            self._rehash_tail(side, pos)
+            self._index_tail(side, pos)
+            self._sync_top()
+        self._zones[card_id] = EMPTY
+        self._removed |= 1 << card_id
+        return location
+
+    def restore(self, card_id, zone, pos):
+        """Put removed card back to position of zone."""
+        assert self.is_removed(card_id), 'card is on the table'
+        if zone == PYRAMID:
+            cards = self._pyramid
+            assert cards[pos] == EMPTY, 'slot is not empty'
+            cards[pos] = card_id
+            self._pyramid_hash ^= _PYRAMID_KEYS[pos * FACES + card_id % FACES]
+            self._zones[card_id] = zone
+            self._positions[card_id] = pos
+            covers = self._covers
+            if not covers[pos]:
+                self._open_slot(pos)
+            for parent in parents(pos):
+                self._close_slot(parent, cards[parent])
+                covers[parent] += 1
+        else:
+            side = self._stock_side ^ (zone == WASTE)
+            cards = self._talon[side]
+            pos = min(pos, len(cards))
+            self._rehash_tail(side, pos)
+            cards.insert(pos, card_id)
+            self._rehash_tail(side, pos)
+            self._index_tail(side, pos)
+            self._sync_top()
+        self._removed &= ~(1 << card_id)
+
+    def _move_top(self, side, other):
+        """Move top card of _talon array side to the top of array other."""
+        cards = self._talon[side]
+        others = self._talon[other]
+        card_id = cards.pop()
+        face = card_id % FACES
+        index = len(cards) * FACES + face
+        new_pos = len(others)
+        new_index = new_pos * FACES + face
+        hashes = self._talon_hashes
+        # keys of roles which are not computed are skipped
+        if hashes[2 * side] is not None:
+            hashes[2 * side] ^= _STOCK_KEYS[index]
+        if hashes[2 * side + 1] is not None:
+            hashes[2 * side + 1] ^= _WASTE_KEYS[index]
+        if hashes[2 * other] is not None:
+            hashes[2 * other] ^= _STOCK_KEYS[new_index]
+        if hashes[2 * other + 1] is not None:
+            hashes[2 * other + 1] ^= _WASTE_KEYS[new_index]
+        others.append(card_id)
+        self._zones[card_id] = STOCK + other
+        self._positions[card_id] = new_pos
+
+    def draw(self):
+        """Move top card of stock to waste. Empty stock is refilled from
+        waste in the same order if pass limit allows it.
+        :return: card id or EMPTY if no card was drawn"""
+        if not self._talon[self._stock_side]:
+            if not self.can_draw:
+                return EMPTY
+            # waste array becomes the stock, its top is drawn first
+            self._swap_sides()
+            self._recycles += 1
+        self._move_top(self._stock_side, self._stock_side ^ 1)
+        self._sync_top()
+        return self._top
+
+    def undo_draw(self, recycled=False):
+        """Move top card of waste back to stock, reverse of draw.
+        :param recycled: True if draw refilled stock from waste"""
+        self._move_top(self._stock_side ^ 1, self._stock_side)
+        if recycled:
+            self._swap_sides()
+            self._recycles -= 1
+        self._sync_top()
+
+    def playable(self, face):
+        """Return set of playable card ids of face."""
+        buckets = self._buckets
+        if buckets is None:
+            buckets = self._build_buckets()
+        return buckets[face]
+
+    def moves(self, suited=False, target=TARGET, aces_high=False,
+              faces=None):
+        """Generate legal moves, single cards (kings) first: tuples of one
+        or two card ids with sum of values target.
+        :param suited: pairs must have the same suit (hard mode)
+        :param aces_high: ace value is 14 instead of 1
+        :param faces: faces of rules.RuleSet, it replaces the rules above"""
+        buckets = self._buckets
+        if buckets is None:
+            buckets = self._build_buckets()
+        singles, pairs = faces or move_faces(target, aces_high, suited)
+        for face in singles:
+            for card_id in buckets[face]:
+                yield card_id,
+        for face, other in pairs:
+            if not buckets[face] or not buckets[other]:
+                continue
+            if face == other:
+                yield from combinations(buckets[face], 2)
+                continue
+            for card_id in buckets[face]:
+                for other_id in buckets[other]:
+                    yield card_id, other_id
+
+    def copy(self):
+        """Return independent copy of state."""
+        res = GameState.__new__(GameState)
+        res._rows = self._rows
+        res._pyramid = array('h', self._pyramid)
+        res._talon = [array('h', cards) for cards in self._talon]
+        res._stock_side = self._stock_side
+        res._recycles = self._recycles
+        res._max_passes = self._max_passes
+        res._removed = self._removed
+        res._pyramid_hash = self._pyramid_hash
+        res._talon_hashes = list(self._talon_hashes)
+        res._zones = array('b', self._zones)
+        res._positions = array('h', self._positions)
+        res._covers = array('b', self._covers)
+        res._open = set(self._open)
+        res._buckets = None if self._buckets is None else \
+            [set(bucket) for bucket in self._buckets]
+        res._top = self._top
+        return res
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        if not isinstance(other, GameState):
+            return NotImplemented
+        return self.hash == other.hash and \
+            self._pyramid == other._pyramid and \
+            self.stock == other.stock and self.waste == other.waste
+
+    def __str__(self):
+        return 'GameState: Rows-{}; Stock-{}; Waste-{}; Pass-{}; ' \
+            'Hash-{:016x}'.format(self._rows, self.stock_size,
+                                  self.waste_size, self.passes, self.hash)
+
+
+def test():
+    # ---------------- Test ----------------
+    s = GameState(range(28), range(28, 52))
+    h = s.hash
+    s.draw()
+    print(s)
+    location = s.remove(51)
+    s.restore(51, *location)
+    print(s.is_open(27), s.is_open(0))
+    s2 = s.copy()
+    s2.draw()
+    print(s == s2, hash(s) == h)
+
+
+if __name__ == '__main__':
+    test()